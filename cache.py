@@ -0,0 +1,98 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+def cache_key(*inputs):
+    """
+    Input: inputs, the values a computation depends on (numbers, strings, dates and tuples of them)
+    Returns the sha256 hex digest of the exact representation of inputs (floats are represented exactly by repr)
+    """
+    return hashlib.sha256(repr(inputs).encode()).hexdigest()
+
+
+class ScheduleCache:
+    """
+    Content addressed cache of computed cash flows: one .npy file per key (see cache_key) in a directory shared by
+    every process using it. Files are replaced atomically, so readers never see a partly written entry. Reading an
+    entry touches its modification time and, when the files pass max_size bytes, the least recently used ones are
+    removed until the cache is back to three quarters of it
+    """
+
+    def __init__(self, directory, max_size):
+        """
+        Input: directory, the cache directory (created if it does not exist)
+        Input: max_size, the size in bytes the cache is kept under
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        # size of the files, as of the last scan plus the files written since
+        self.size = sum(size for mtime, size, path in self.entries())
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """
+        Returns a list of (modification time, size, path) tuples of the cache files, least recently used first
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # removed by another process
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def get(self, key):
+        """
+        Input: key, a cache key
+        Returns the array cached under key, None if there is none
+        """
+        path = self.directory / f"{key}.npy"
+        try:
+            values = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return values
+
+    def put(self, key, values):
+        """
+        Input: key, a cache key
+        Input: values, a numpy array
+        Caches values under key, then evicts the least recently used entries if the cache is over max_size
+        """
+        path = self.directory / f"{key}.npy"
+        # one temporary file per process, so concurrent writers of the same key don't mix their bytes
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as file:
+            np.save(file, values)
+        # a key written again replaces its file: only the difference in size is added
+        try:
+            old_size = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size = 0
+        os.replace(temp, path)
+        self.size += os.path.getsize(path) - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is under three quarters of max_size
+        """
+        entries = self.entries()
+        self.size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if self.size <= self.max_size * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -0,0 +1,133 @@
+import json
+import os
+from datetime import date
+
+import numpy as np
+
+
+# column files of the columnar format, by table: name -> dtype. Amortization dates are stored as date ordinals
+AMORTIZATION_COLUMNS = {
+    "id": np.int64,
+    "loan_id": np.int32,
+    "value": np.float64,
+    "amort_date": np.int32,
+}
+
+# description of the column files (key and date they were written for), written last
+META_FILE = "meta.json"
+
+
+class ColumnStore:
+    """
+    Read side of the columnar format: amortizations sorted by loan and the packed schedules of the loans, one .npy
+    file per column. Files are memory mapped when first used, so a lookup only reads the pages of the loans it
+    touches. Each table has an offsets index (loan id, first row, end row) searched with binary search
+    """
+
+    def __init__(self, directory):
+        """
+        Input: directory, the directory written by write_columns
+        Raises OSError or ValueError if the directory has no readable meta file
+        """
+        self.directory = directory
+        with open(directory / META_FILE) as file:
+            self.meta = json.load(file)
+        # file name -> memory mapped array
+        self.arrays = {}
+
+    def array(self, name):
+        """
+        Input: name, a column file name without extension
+        Returns the column as a read only memory mapped array
+        """
+        if name not in self.arrays:
+            self.arrays[name] = np.load(self.directory / f"{name}.npy", mmap_mode="r")
+        return self.arrays[name]
+
+    def rows(self, table, loan_id):
+        """
+        Input: table, "amortizations" or "schedules"
+        Input: loan_id, the id of a loan
+        Returns the (start, end) range of the rows (columns for schedules) of loan_id, None if it has none
+        """
+        index = self.array(f"{table}.index")
+        i = np.searchsorted(index[0], loan_id)
+        if i == index.shape[1] or index[0, i] != loan_id:
+            return None
+        return int(index[1, i]), int(index[2, i])
+
+    def amortizations(self, loan_id):
+        """
+        Input: loan_id, the id of a loan
+        Returns a list with the amortizations of loan_id as dicts of id, value and amort_date, in the order they
+        were written
+        """
+        if (rows := self.rows("amortizations", loan_id)) is None:
+            return []
+        start, end = rows
+        ids, values, dates = (self.array(f"amortizations.{name}")[start:end] for name in ("id", "value", "amort_date"))
+        return [{"id": int(id), "value": float(value), "amort_date": date.fromordinal(int(ordinal))}
+                for id, value, ordinal in zip(ids, values, dates)]
+
+    def schedule(self, loan_id):
+        """
+        Input: loan_id, the id of a loan
+        Returns a writable copy of the packed schedule values of loan_id (see LoanSchedule), None if it has none
+        """
+        if (rows := self.rows("schedules", loan_id)) is None:
+            return None
+        start, end = rows
+        return np.array(self.array("schedules.values")[:, start:end])
+
+
+def write_array(directory, name, array):
+    """
+    Input: directory, the directory of the column files
+    Input: name, the file name without extension
+    Input: array, a numpy array
+    Writes array to a temporary file that replaces the column file once complete
+    """
+    path = directory / f"{name}.npy"
+    with open(f"{path}.tmp", "wb") as file:
+        np.save(file, array)
+    os.replace(f"{path}.tmp", path)
+
+
+def offsets_index(loan_ids, lengths):
+    """
+    Input: loan_ids, the sorted loan ids of a table
+    Input: lengths, the number of rows (columns for schedules) of each loan
+    Returns the offsets index of the table: rows loan id, first row and end row
+    """
+    ends = np.cumsum(lengths, dtype=np.int64)
+    return np.stack([np.asarray(loan_ids, dtype=np.int64), ends - lengths, ends])
+
+
+def write_columns(directory, meta, amortizations, schedules, columns):
+    """
+    Input: directory, the directory of the column files (created if it does not exist)
+    Input: meta, a dict saved with the files (i.e. the key they are valid for)
+    Input: amortizations, a list of (id, loan_id, value, amort_date ordinal) tuples
+    Input: schedules, a list of (loan_id, packed schedule values) tuples
+    Input: columns, the number of packed schedule rows
+    Writes amortizations, grouped by loan in a stable order, and schedules, sorted by loan, with their offsets
+    indexes. The meta file is removed first and written last, so a partly written directory is never read
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    if (directory / META_FILE).exists():
+        os.remove(directory / META_FILE)
+    table = {name: np.array([row[i] for row in amortizations], dtype=dtype)
+             for i, (name, dtype) in enumerate(AMORTIZATION_COLUMNS.items())}
+    order = np.argsort(table["loan_id"], kind="stable")
+    for name, column in table.items():
+        write_array(directory, f"amortizations.{name}", column[order])
+    loan_ids, counts = np.unique(table["loan_id"], return_counts=True)
+    write_array(directory, "amortizations.index", offsets_index(loan_ids, counts))
+    schedules = sorted(schedules, key=lambda schedule: schedule[0])
+    values = [schedule[1] for schedule in schedules]
+    write_array(directory, "schedules.values", np.concatenate(values, axis=1) if values else np.zeros((columns, 0)))
+    write_array(directory, "schedules.index", offsets_index([schedule[0] for schedule in schedules],
+                                                            np.array([v.shape[1] for v in values], dtype=np.int64)))
+    with open(directory / f"{META_FILE}.tmp", "w") as file:
+        json.dump(meta, file)
+    os.replace(directory / f"{META_FILE}.tmp", directory / META_FILE)
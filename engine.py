@@ -0,0 +1,457 @@
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice, repeat
+
+import numpy as np
+
+from helpers import MONTHS, CALENDAR_CACHE_SIZE, SCHEDULE_CACHE_SIZE, compounding_factors, \
+    generate_actual_amortization_schedule, period_calendar
+
+
+# Everything the cash flows of one loan depend on. i_m is the monthly effective rate, balance the principal
+# balance and amortizations a sequence of objects with amort_date and value attributes
+LoanTerms = namedtuple("LoanTerms", ["face", "issue", "term", "frequency", "i_m", "interest_frequency", "balance",
+                                     "amortizations"])
+# Plain amortization record, for sending amortizations to worker processes
+AmortizationRow = namedtuple("AmortizationRow", ["amort_date", "value"])
+
+
+# Array-backed schedule engine: same results as generate_amortizations, generate_principals and
+# generate_interests in helpers.py, but each column is built with a few vectorized operations
+
+
+def round_array(values, ndigits):
+    """
+    Input: values, a numpy array of floats
+    Input: ndigits, the number of decimals to round to
+    Returns a new array rounded exactly like the built-in round() would round each element
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, ndigits, out=np.empty_like(values))
+    # np.round scales by 10 ** ndigits before rounding, which can turn a value lying just below a
+    # half into an exact half. Only those near-ties can disagree with round(), so fix them one by one
+    scaled = values * 10.0 ** ndigits
+    distance = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5)
+    for i in np.flatnonzero(distance <= np.abs(scaled) * 1e-12 + 1e-12):
+        rounded.flat[i] = round(float(values.flat[i]), ndigits)
+    return rounded
+
+
+def payment_mask(term, frequency):
+    """
+    Input: term, an int specifying the number of months of one loan
+    Input: frequency, a string specifying the payment frequency
+    Returns a boolean array with True in the months where a payment takes place
+    """
+    mask = np.zeros(term, dtype=bool)
+    if frequency != "at maturity":
+        mask[MONTHS[frequency] - 1::MONTHS[frequency]] = True
+    else:
+        mask[-1] = True
+    return mask
+
+
+# Column builders. Every builder works on the last axis, so the same code computes one loan (1D arrays)
+# or a whole group of loans sharing term and frequencies (2D arrays, one row per loan)
+def amortization_column(face, term, frequency):
+    """
+    Input: face, the loan face value (or an array of face values)
+    Input: term, an int specifying the number of months of one loan
+    Input: frequency, a string specifying the payment frequency
+    Returns an array with the scheduled amortization of each month
+    """
+    face = np.asarray(face, dtype=float)
+    n = term / MONTHS[frequency] if frequency != "at maturity" else 1
+    amortizations = np.zeros(face.shape + (term,))
+    amortizations[..., payment_mask(term, frequency)] = round_array(face / n, 2)[..., None]
+    return amortizations
+
+
+def principal_columns(face, amortizations):
+    """
+    Input: face, the loan face value (or an array of face values)
+    Input: amortizations, an array with the amortization of each month
+    Returns two arrays with the principal of each month before and after amortization
+    """
+    face = np.asarray(face, dtype=float)
+    # subtract.accumulate subtracts one month at a time, so the float results match the loop version
+    principals = np.subtract.accumulate(np.concatenate((face[..., None], amortizations), axis=-1), axis=-1)[..., 1:]
+    return round_array(principals + amortizations, 2), round_array(principals, 2)
+
+
+def interest_column(principals_b, i_m, frequency):
+    """
+    Input: principals_b, an array with the principal of each month before amortization
+    Input: i_m, the monthly effective rate (or an array of rates)
+    Input: frequency, a string specifying the interest payment frequency
+    Returns an array with the scheduled interest payment of each month
+    """
+    i_m = np.asarray(i_m, dtype=float)
+    term = principals_b.shape[-1]
+    # calculate months until interest payment
+    n = MONTHS[frequency] if (frequency != "at maturity") else term
+    # monthly interests, rounded like calculate_interest does
+    interests_m = round_array(i_m[..., None] * principals_b / 100, 2)
+    # future value factors come from the shared compounding factor tables and are looked up by months to payment
+    months = np.arange(1, term + 1)
+    comp_periods = np.where(months % n != 0, n - months % n, 0)
+    factors = np.array([compounding_factors(rate, n) for rate in i_m.ravel().tolist()])
+    fv_interests = interests_m * factors.reshape(i_m.shape + (n + 1,))[..., comp_periods]
+    # accrued interest: one row per interest payment period, accumulated month by month
+    padded = np.zeros(fv_interests.shape[:-1] + (-(-term // n) * n,))
+    padded[..., :term] = fv_interests
+    accrued = np.cumsum(padded.reshape(padded.shape[:-1] + (-1, n)), axis=-1)[..., -1]
+    interests = np.zeros_like(principals_b)
+    mask = payment_mask(term, frequency)
+    interests[..., mask] = round_array(accrued[..., :mask.sum()], 2)
+    return interests
+
+
+# Fixed-point columns: money held as int64 cents. Amounts are converted to cents once, and amortizations,
+# principals and monthly interests are exact integer arithmetic. Interest accrual is not: the monthly interests
+# are carried forward with the float compounding factors and summed in float64, then the interest paid at each
+# payment date is rounded half up to the cent. The due amount of generate_actual_amortization_schedule
+# (helpers.py) is out of scope: it is computed from float principals in both modes
+def to_cents(values):
+    """
+    Input: values, an amount or an array of amounts in dollars
+    Returns the amounts as int64 cents, rounded half up
+    """
+    return np.floor(np.asarray(values, dtype=float) * 100 + 0.5).astype(np.int64)
+
+
+def amortization_cents(face, term, frequency):
+    """
+    Input: face, the loan face value in cents (or an array of face values)
+    Input: term, an int specifying the number of months of one loan
+    Input: frequency, a string specifying the payment frequency
+    Returns an int64 array with the scheduled amortization of each month in cents
+    """
+    face = np.asarray(face, dtype=np.int64)
+    n = term // MONTHS[frequency] if frequency != "at maturity" else 1
+    amortizations = np.zeros(face.shape + (term,), dtype=np.int64)
+    amortizations[..., payment_mask(term, frequency)] = ((2 * face + n) // (2 * n))[..., None]
+    return amortizations
+
+
+def principal_cents(face, amortizations):
+    """
+    Input: face, the loan face value in cents (or an array of face values)
+    Input: amortizations, an int64 array with the amortization of each month in cents
+    Returns two int64 arrays with the principal of each month before and after amortization in cents
+    """
+    principals = np.asarray(face, dtype=np.int64)[..., None] - np.cumsum(amortizations, axis=-1)
+    return principals + amortizations, principals
+
+
+def interest_cents(principals_b, i_m, frequency):
+    """
+    Input: principals_b, an int64 array with the principal of each month before amortization in cents
+    Input: i_m, the monthly effective rate (or an array of rates), in percentage with 4 decimals
+    Input: frequency, a string specifying the interest payment frequency
+    Returns an int64 array with the scheduled interest payment of each month in cents
+    """
+    i_m = np.asarray(i_m, dtype=float)
+    term = principals_b.shape[-1]
+    n = MONTHS[frequency] if (frequency != "at maturity") else term
+    # monthly rate as an integer number of 1/1,000,000ths, so monthly interests are exact integer products
+    rate_units = np.rint(i_m * 10000).astype(np.int64)[..., None]
+    interests_m = (2 * principals_b * rate_units + 1000000) // 2000000
+    months = np.arange(1, term + 1)
+    comp_periods = np.where(months % n != 0, n - months % n, 0)
+    factors = np.array([compounding_factors(rate, n) for rate in i_m.ravel().tolist()])
+    # float step: future values of the integer monthly interests, accrued in float64 until rounded below
+    fv_interests = interests_m * factors.reshape(i_m.shape + (n + 1,))[..., comp_periods]
+    padded = np.zeros(fv_interests.shape[:-1] + (-(-term // n) * n,))
+    padded[..., :term] = fv_interests
+    accrued = np.cumsum(padded.reshape(padded.shape[:-1] + (-1, n)), axis=-1)[..., -1]
+    interests = np.zeros_like(principals_b)
+    mask = payment_mask(term, frequency)
+    interests[..., mask] = np.floor(accrued[..., :mask.sum()] + 0.5).astype(np.int64)
+    return interests
+
+
+def scheduled_columns(face, term, frequency, i_m, interest_frequency, cents=False):
+    """
+    Input: face, the loan face value (or an array of face values)
+    Input: term, an int specifying the number of months of the loans
+    Input: frequency, a string specifying the payment frequency
+    Input: i_m, the monthly effective rate (or an array of rates)
+    Input: interest_frequency, a string specifying the interest payment frequency
+    Input: cents, True to compute with the fixed-point (int64 cents) columns
+    Returns the scheduled amortization, principal before and after amortization and interest arrays
+    """
+    if cents:
+        amortizations = amortization_cents(to_cents(face), term, frequency)
+        principals_b, principals_a = principal_cents(to_cents(face), amortizations)
+        interests = interest_cents(principals_b, i_m, interest_frequency)
+        return amortizations / 100, principals_b / 100, principals_a / 100, interests / 100
+    amortizations = amortization_column(face, term, frequency)
+    principals_b, principals_a = principal_columns(face, amortizations)
+    return amortizations, principals_b, principals_a, interest_column(principals_b, i_m, interest_frequency)
+
+
+def actual_columns(face, actual_amortizations, i_m, interest_frequency, cents=False):
+    """
+    Input: face, the loan face value (or an array of face values)
+    Input: actual_amortizations, an array with the actual amortization schedule of each month
+    Input: i_m, the monthly effective rate (or an array of rates)
+    Input: interest_frequency, a string specifying the interest payment frequency
+    Input: cents, True to compute with the fixed-point (int64 cents) columns
+    Returns the actual principal before and after amortization and interest arrays
+    """
+    if cents:
+        principals_b, principals_a = principal_cents(to_cents(face), to_cents(actual_amortizations))
+        return principals_b / 100, principals_a / 100, interest_cents(principals_b, i_m, interest_frequency) / 100
+    principals_b, principals_a = principal_columns(face, actual_amortizations)
+    return principals_b, principals_a, interest_column(principals_b, i_m, interest_frequency)
+
+
+def generate_periods(issue, term):
+    """
+    Input: issue, the loan issue date
+    Input: term, an int specifying the number of months of one loan
+    Returns a tuple with the date of each monthly period, taken from the shared period calendar
+    """
+    return period_calendar(issue, term)[1:]
+
+
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def calendar_index(issue, term):
+    """
+    Input: issue, the loan issue date
+    Input: term, an int specifying the number of months of one loan
+    Returns a dict mapping the date of each monthly period to its position. Shared like the period calendar
+    """
+    return {period: i for i, period in enumerate(generate_periods(issue, term))}
+
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def shared_scheduled(face, term, frequency, i_m, interest_frequency, cents=False):
+    """
+    Input: face, the loan face value
+    Input: term, an int specifying the number of months of the loan
+    Input: frequency, a string specifying the payment frequency
+    Input: i_m, the monthly effective rate
+    Input: interest_frequency, a string specifying the interest payment frequency
+    Input: cents, True to compute with the fixed-point (int64 cents) columns
+    Returns the read only array of the scheduled columns (see scheduled_columns), shared by every loan with the same
+    terms. The face value is part of the terms: every column is rounded to cents, so the columns of a unit face
+    value scaled by each face value would not be the ones computed for that face value
+    """
+    return read_only(np.array(scheduled_columns(face, term, frequency, i_m, interest_frequency, cents)))
+
+
+def read_only(values):
+    """
+    Input: values, a numpy array
+    Returns values, made read only so that it can be shared
+    """
+    values.setflags(write=False)
+    return values
+
+
+class LoanSchedule:
+    """
+    Cash flows of one loan: a period axis shared with every loan issued on the same date with the same term, and
+    one float64 row per column, in place of one date-keyed dict per column. The scheduled rows are one block that
+    may be shared with other loans with the same terms (see shared_scheduled), the actual rows another one
+    """
+    # Rows, named after the Loan attributes that expose them
+    COLUMNS = (
+        "amort_schedule",
+        "scheduled_principals_b_amort",
+        "scheduled_principals_a_amort",
+        "interest_payment_schedule",
+        "actual_amort_schedule",
+        "actual_amortizations_dict",
+        "actual_principals_b_amort",
+        "actual_principals_a_amort",
+        "actual_interest_payment_schedule"
+    )
+    ROWS = {column: row for row, column in enumerate(COLUMNS)}
+    # the first SCHEDULED rows are the scheduled cash flow
+    SCHEDULED = 4
+
+    __slots__ = ("calendar", "index", "scheduled", "actual")
+
+    def __init__(self, issue, term, values=None):
+        # values: the rows of every column, packed like the values property
+        self.calendar = period_calendar(issue, term)
+        self.index = calendar_index(issue, term)
+        if values is None:
+            # two separate blocks, so that the actual one doesn't keep a replaced scheduled one alive
+            self.scheduled = np.zeros((self.SCHEDULED, term))
+            self.actual = np.zeros((len(self.COLUMNS) - self.SCHEDULED, term))
+        else:
+            self.scheduled = values[:self.SCHEDULED]
+            self.actual = values[self.SCHEDULED:]
+
+    @property
+    def term(self):
+        return self.actual.shape[1]
+
+    @property
+    def values(self):
+        # every row packed in one array, in COLUMNS order
+        return np.concatenate((self.scheduled, self.actual))
+
+    def row(self, row):
+        # the array of one row of COLUMNS (read only if the scheduled block is shared)
+        if row < self.SCHEDULED:
+            return self.scheduled[row]
+        return self.actual[row - self.SCHEDULED]
+
+    def column(self, name):
+        # date-keyed, read only view of one column
+        return ScheduleColumn(self, self.ROWS[name])
+
+    def set_column(self, name, values):
+        # values: an array, a sequence or a date-keyed dict in period order
+        if isinstance(values, Mapping):
+            values = np.fromiter(values.values(), dtype=float, count=self.term)
+        row = self.ROWS[name]
+        if row < self.SCHEDULED and not self.scheduled.flags.writeable:
+            # a shared block: the loan gets its own copy
+            self.scheduled = self.scheduled.copy()
+        self.row(row)[:] = values
+
+    def calculate_scheduled(self, face, frequency, i_m, interest_frequency, cents=False):
+        """
+        Input: face, the loan face value
+        Input: frequency, a string specifying the payment frequency
+        Input: i_m, the monthly effective rate
+        Input: interest_frequency, a string specifying the interest payment frequency
+        Input: cents, True to compute with the fixed-point (int64 cents) columns
+        Computes the scheduled amortization, principal and interest columns, or shares them with a loan with the
+        same terms
+        """
+        self.scheduled = shared_scheduled(face, self.term, frequency, i_m, interest_frequency, cents)
+
+    def calculate_actual(self, face, i_m, interest_frequency, start=0, cents=False):
+        """
+        Input: face, the loan face value
+        Input: i_m, the monthly effective rate
+        Input: interest_frequency, a string specifying the interest payment frequency
+        Input: start, the first period to recompute; earlier periods keep their values
+        Input: cents, True to compute with the fixed-point (int64 cents) columns
+        Computes the actual principal and interest columns from the actual amortization schedule column
+        """
+        amortizations = self.row(self.ROWS["actual_amort_schedule"])
+        principals_b = self.row(self.ROWS["actual_principals_b_amort"])
+        principals_a = self.row(self.ROWS["actual_principals_a_amort"])
+        interests = self.row(self.ROWS["actual_interest_payment_schedule"])
+        # restart interests at the beginning of the interest payment period containing start
+        n = MONTHS[interest_frequency] if (interest_frequency != "at maturity") else self.term
+        interest_start = start - start % n
+        if cents:
+            # principal before period start: integer sums are exact, so it is a plain subtraction
+            face = to_cents(face) - to_cents(amortizations[:start]).sum()
+            b, a = principal_cents(face, to_cents(amortizations[start:]))
+            principals_b[start:], principals_a[start:] = b / 100, a / 100
+            interests[interest_start:] = interest_cents(
+                to_cents(principals_b[interest_start:]), i_m, interest_frequency) / 100
+            return
+        if start:
+            # principal before period start, subtracted month by month like a full pass would
+            face = np.subtract.accumulate(np.concatenate(([face], amortizations[:start])))[-1]
+        principals_b[start:], principals_a[start:] = principal_columns(face, amortizations[start:])
+        interests[interest_start:] = interest_column(principals_b[interest_start:], i_m, interest_frequency)
+
+
+class ScheduleColumn(Mapping):
+    """
+    One column of a LoanSchedule, looked up by period date like the dicts it replaces
+    """
+    __slots__ = ("schedule", "row")
+
+    def __init__(self, schedule, row):
+        self.schedule = schedule
+        self.row = row
+
+    def __getitem__(self, period):
+        return self.schedule.row(self.row).item(self.schedule.index[period])
+
+    def __iter__(self):
+        return islice(self.schedule.calendar, 1, None)
+
+    def __len__(self):
+        return self.schedule.term
+
+    def values(self):
+        return self.schedule.row(self.row).tolist()
+
+    def copy(self):
+        return dict(zip(self, self.values()))
+
+
+# Portfolio computation
+def batch_schedules(rows, cents=False):
+    """
+    Input: rows, a list of LoanTerms
+    Input: cents, True to compute with the fixed-point (int64 cents) columns
+    Returns a list with the LoanSchedule of each row. Loans sharing term and frequencies are stacked into
+    arrays (one row per loan) and each group is computed in one pass. Loans of a group with the same face value and
+    rate share their scheduled columns, computed once
+    """
+    schedules = [None] * len(rows)
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault((row.term, row.frequency, row.interest_frequency), []).append(i)
+    for (term, frequency, interest_frequency), group in groups.items():
+        faces = np.array([rows[i].face for i in group])
+        rates = np.array([rows[i].i_m for i in group])
+        # scheduled cash flow: computed for each distinct (face value, rate) pair, one shared block per pair
+        pairs, shared = np.unique(np.stack((faces, rates), axis=1), axis=0, return_inverse=True)
+        columns = np.stack(scheduled_columns(pairs[:, 0], term, frequency, pairs[:, 1], interest_frequency, cents),
+                           axis=1)
+        blocks = [read_only(block) for block in columns]
+        # actual cash flow: the actual amortization schedule depends on each loan's amortizations, the rest is stacked again
+        actual_amortizations = np.empty((len(group), term))
+        for k, i in enumerate(group):
+            schedule = schedules[i] = LoanSchedule(rows[i].issue, term)
+            schedule.scheduled = blocks[shared[k]]
+            actual_amort_schedule, actual_amortizations_dict = generate_actual_amortization_schedule(
+                rows[i].issue, schedule.column("amort_schedule"), rows[i].amortizations, rows[i].balance,
+                schedule.column("scheduled_principals_a_amort"))
+            schedule.set_column("actual_amort_schedule", actual_amort_schedule)
+            schedule.set_column("actual_amortizations_dict", actual_amortizations_dict)
+            actual_amortizations[k] = schedule.row(LoanSchedule.ROWS["actual_amort_schedule"])
+        principals_b, principals_a, interests = actual_columns(
+            faces, actual_amortizations, rates, interest_frequency, cents)
+        for k, i in enumerate(group):
+            schedules[i].set_column("actual_principals_b_amort", principals_b[k])
+            schedules[i].set_column("actual_principals_a_amort", principals_a[k])
+            schedules[i].set_column("actual_interest_payment_schedule", interests[k])
+    return schedules
+
+
+def schedule_values(rows, cents=False):
+    # worker process entry point: only the packed arrays go back, calendars are rebuilt by the parent
+    return [schedule.values for schedule in batch_schedules(rows, cents)]
+
+
+def parallel_schedules(rows, workers, chunk_size, cents=False):
+    """
+    Input: rows, a list of LoanTerms
+    Input: workers, the number of worker processes
+    Input: chunk_size, the number of loans sent to a worker at a time
+    Input: cents, True to compute with the fixed-point (int64 cents) columns
+    Returns a list with the LoanSchedule of each row, computed by batch_schedules in a pool of processes
+    """
+    # sort by term and frequencies so each chunk holds few, large groups
+    order = sorted(range(len(rows)), key=lambda i: (rows[i].term, rows[i].frequency, rows[i].interest_frequency))
+    chunks = []
+    for start in range(0, len(order), chunk_size):
+        chunks.append([rows[i]._replace(amortizations=tuple(AmortizationRow(amort.amort_date, amort.value)
+                                                            for amort in rows[i].amortizations))
+                       for i in order[start:start + chunk_size]])
+    schedules = [None] * len(rows)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        positions = iter(order)
+        for chunk, values in zip(chunks, executor.map(schedule_values, chunks, repeat(cents))):
+            for row, row_values in zip(chunk, values):
+                schedules[next(positions)] = LoanSchedule(row.issue, row.term, row_values)
+    return schedules
@@ -1,7 +1,10 @@
-from functools import reduce
-from datetime import date
+from bisect import bisect_left
+from functools import lru_cache, reduce
+from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 import csv
+import hashlib
+import os
 
 from pyfiglet import Figlet
 from tabulate import tabulate
@@ -26,6 +29,15 @@ PERIODS = {
 
 TYPES = ["effective", "nominal"]
 
+# Number of (issue date, term) calendars kept in memory by period_calendar
+CALENDAR_CACHE_SIZE = 4096
+# Number of rate conversions and compounding factor tables kept in memory
+RATE_CACHE_SIZE = 1024
+# Number of normalized bank names kept in memory by bank_key
+NAME_CACHE_SIZE = 1024
+# Number of distinct scheduled cash flows kept in memory by engine.shared_scheduled
+SCHEDULE_CACHE_SIZE = 4096
+
 
 # Functions
 def check_frequency(term, frequency):
@@ -49,6 +61,46 @@ def check_frequency(term, frequency):
         return False
 
 
+def check_amortization_value(value, balance):
+    """
+    Input: value, the amortization value as a number or as a string (i.e. user's input or csv field)
+    Input: balance, the principal balance of the loan the amortization belongs to
+    Returns value as a float if it is a positive number not greater than balance, otherwise raises ValueError
+    """
+    try:
+        value = float(value)
+        if value < 0:
+            raise ValueError
+    except ValueError:
+        raise ValueError("Amortization value must be a positive number")
+    if value > balance:
+        raise ValueError(
+            f"Amortization value (${value:,.2f}) can not be greater than loan balance (${balance:,.2f})")
+    return value
+
+
+def check_amortization_date(amort_date, issue, maturity, today):
+    """
+    Input: amort_date, the amortization date as a date or as a YYYY-MM-DD string
+    Input: issue, the issue date of the loan the amortization belongs to
+    Input: maturity, the maturity date of that loan
+    Input: today, the current date
+    Returns amort_date as a date if it is after issue and not after maturity nor today, otherwise raises ValueError
+    """
+    if not isinstance(amort_date, date):
+        try:
+            amort_date = datetime.strptime(amort_date, '%Y-%m-%d').date()
+        except ValueError:
+            print("Invalid date format, should be YYYY-MM-DD")
+    if not amort_date <= today:
+        raise ValueError(
+            f"Amortization date ({str(amort_date)}) can not be greater than today ({str(today)})")
+    if not issue < amort_date <= maturity:
+        raise ValueError(
+            f"Amortization date ({str(amort_date)}) can not be less than or equal to loan issue date ({str(issue)}) and can not be greater than loan maturity date ({str(maturity)})")
+    return amort_date
+
+
 def get_obj(l, v, lookup_att):
     """
     Input: l, a list of objects
@@ -62,6 +114,74 @@ def get_obj(l, v, lookup_att):
     return None
 
 
+def get_by_id(index, id):
+    """
+    Input: index, a dict mapping ids to objects
+    Input: id, the id of the object, as an int or as a string (i.e. user's input)
+    Returns obj if the object is found, otherwise None
+    """
+    try:
+        return index.get(int(id))
+    except (TypeError, ValueError):
+        return None
+
+
+def add_obj(l, index, obj):
+    """
+    Input: l, a list of objects
+    Input: index, a dict mapping the ids of the objects in l to the objects
+    Input: obj, the object to add
+    Appends obj to l and registers it in index
+    """
+    l.append(obj)
+    index[obj.id] = obj
+
+
+def remove_obj(l, index, obj):
+    """
+    Input: l, a list of objects
+    Input: index, a dict mapping the ids of the objects in l to the objects
+    Input: obj, the object to remove
+    Removes obj from l and from index. Only the index update is constant time: l keeps the order the reports and
+    the csv files are written in, so removing from it is a linear scan (identity comparisons, the models don't
+    define __eq__)
+    """
+    l.remove(obj)
+    del index[obj.id]
+
+
+def link_obj(index, key, obj):
+    """
+    Input: index, a dict mapping keys to sets of objects
+    Input: key, the key obj is grouped under
+    Input: obj, the object to add
+    Adds obj to the set of objects stored under key
+    """
+    index.setdefault(key, set()).add(obj)
+
+
+def unlink_obj(index, key, obj):
+    """
+    Input: index, a dict mapping keys to sets of objects
+    Input: key, the key obj is grouped under
+    Input: obj, the object to remove
+    Removes obj from the set of objects stored under key, dropping the set once it is empty
+    """
+    if group := index.get(key):
+        group.discard(obj)
+        if not group:
+            del index[key]
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def bank_key(name):
+    """
+    Input: name, a bank name as typed by the user or read from the csv database
+    Returns the normalized (case insensitive) name banks are stored and looked up by
+    """
+    return name.lower().title()
+
+
 def message_to_figlet(message, font):
     """
     Input: message, a message string to render
@@ -74,6 +194,28 @@ def message_to_figlet(message, font):
     print(f"{figlet.renderText(message)}")
 
 
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def period_calendar(issue, term):
+    """
+    Input: issue, the loan issue date
+    Input: term, an int specifying the number of months of one loan
+    Returns a tuple with the issue date followed by the date of each monthly period. Calendars are memoized,
+    so every schedule of a loan, and every loan issued on the same date with the same term, share one calendar
+    """
+    return tuple(issue + relativedelta(months=i) for i in range(term + 1))
+
+
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def maturity_date(issue, term):
+    """
+    Input: issue, the loan issue date
+    Input: term, an int specifying the number of months of one loan
+    Returns the loan maturity date: the last date of the period calendar, computed on its own so that validating
+    a date doesn't build the whole calendar
+    """
+    return issue + relativedelta(months=term)
+
+
 def generate_amortizations(face, term, issue, frequency):
     amortizations = {}
     # calculate amortization periods
@@ -84,9 +226,10 @@ def generate_amortizations(face, term, issue, frequency):
     n = term / MONTHS[frequency] if frequency != "at maturity" else 1
     # calculate scheduled amortizations
     sch_amort = round(face / n, 2)
+    periods = period_calendar(issue, term)
     for i in range(term):
         # generate monthly periods
-        date_i = issue + relativedelta(months=i + 1)
+        date_i = periods[i + 1]
         # checking if period divided by MONTHS has a remainder
         if frequency != "at maturity" and (i + 1) % MONTHS[frequency] == 0:
             amortizations[date_i] = sch_amort
@@ -97,28 +240,64 @@ def generate_amortizations(face, term, issue, frequency):
     return amortizations
 
 
-def generate_actual_amortization_schedule(issue, sch_amortizations, actual_amortizations, principal, sch_principals_a_amort):
+def first_open_period(issue, term):
+    """
+    Input: issue, the loan issue date
+    Input: term, an int specifying the number of months of one loan
+    Returns the index of the first period whose actual amortization depends on the loan balance. Periods before it
+    only hold the amortizations already made, so they don't change unless an amortization in them changes
+    """
+    periods = period_calendar(issue, term)
+    today = date.today()
+    if today < periods[-1]:
+        # first period ending today or later
+        return bisect_left(periods, today, 1) - 1
+    return term - 1
+
+
+def affected_period(issue, term, amort_date):
+    """
+    Input: issue, the loan issue date
+    Input: term, an int specifying the number of months of one loan
+    Input: amort_date, the date of a new, edited or deleted amortization
+    Returns the index of the first period that must be recomputed after that amortization changes
+    """
+    period = max(bisect_left(period_calendar(issue, term), amort_date) - 1, 0)
+    return min(period, first_open_period(issue, term))
+
+
+def generate_actual_amortization_schedule(issue, sch_amortizations, actual_amortizations, principal, sch_principals_a_amort,
+                                          start=0, previous=None):
+    # start and previous: recompute only from period start (at most first_open_period), reusing the
+    # (actual_amortization_schedule, actual_amortizations_dict) previously computed for the periods before it
     # getting loan term
     term = len(sch_amortizations)
     # getting loan issue_date
     # issue = min(sch_amortizations) + relativedelta(months=- 1)
     # Creating the dict that will be returned
-    actual_amortization_schedule = {}
-    actual_amortizations_dict = {}
+    if start and previous:
+        actual_amortization_schedule = previous[0].copy()
+        actual_amortizations_dict = previous[1].copy()
+    else:
+        start = 0
+        actual_amortization_schedule = {}
+        actual_amortizations_dict = {}
     # getting remaining periods, number of amortizations and future amortization value
     # max_amort_date = max(actual_amortizations, key = lambda x : x.amort_date).amort_date
     # generating all periods
     check = False
     today = date.today()
     last_date = max(sch_amortizations)
+    # period boundaries: issue date followed by every monthly period
+    boundaries = period_calendar(issue, term)
+    amortizations_in_period = bucket_amortizations(boundaries, actual_amortizations)
 
     if today < last_date:
-        for i in range(term):
-            date_i = issue + relativedelta(months=i + 1)
-            date_i_minus_1 = issue + relativedelta(months = i)
+        for i in range(start, term):
+            date_i = boundaries[i + 1]
+            date_i_minus_1 = boundaries[i]
             # date_i_minus_1 = date_i + relativedelta(months= - 1)
-            actual_amort_in_period = sum(amort.value for amort in actual_amortizations if amort.amort_date > date_i_minus_1
-            and amort.amort_date <= date_i)
+            actual_amort_in_period = amortizations_in_period[i]
             # Period less than today
             if date_i_minus_1 < today and date_i < today:
                 actual_amortization_schedule[date_i] = actual_amort_in_period
@@ -135,6 +314,7 @@ def generate_actual_amortization_schedule(issue, sch_amortizations, actual_amort
                 # Amortization payment month
                 else:
                     # Must meet condition that actual principal == scheduled principal
+                    # (float arithmetic in CENTS mode too: due is not part of the fixed-point columns)
                     due = round(principal - sch_principals_a_amort[date_i], 1)
                     if due > 0 and check == False:
                         actual_amortization_schedule[date_i] = actual_amort_in_period + due
@@ -161,11 +341,9 @@ def generate_actual_amortization_schedule(issue, sch_amortizations, actual_amort
                     actual_amortization_schedule[date_i] = sch_amortizations[date_i]
                 actual_amortizations_dict[date_i] = 0
     else:
-        for i in range(term):
-            date_i = issue + relativedelta(months=i + 1)
-            date_i_minus_1 = issue + relativedelta(months = i)
-            actual_amort_in_period = sum(amort.value for amort in actual_amortizations if amort.amort_date > date_i_minus_1
-            and amort.amort_date <= date_i)
+        for i in range(start, term):
+            date_i = boundaries[i + 1]
+            actual_amort_in_period = amortizations_in_period[i]
             # Period differente than last period
             if i != term - 1:
                 actual_amortization_schedule[date_i] = actual_amort_in_period
@@ -177,6 +355,22 @@ def generate_actual_amortization_schedule(issue, sch_amortizations, actual_amort
     return actual_amortization_schedule, actual_amortizations_dict
 
 
+def bucket_amortizations(boundaries, actual_amortizations):
+    """
+    Input: boundaries, a sorted list of dates: loan issue date followed by the date of each monthly period
+    Input: actual_amortizations, a list of amortization objects
+    Returns a list with the sum of the amortizations made in each period (boundaries[i] < date <= boundaries[i + 1])
+    """
+    buckets = [0] * (len(boundaries) - 1)
+    # one pass over the amortizations, locating each period with bisect. The list order is kept so the
+    # sums add up exactly like the old per-period sum() did
+    for amort in actual_amortizations:
+        i = bisect_left(boundaries, amort.amort_date)
+        if 0 < i < len(boundaries):
+            buckets[i - 1] += amort.value
+    return buckets
+
+
 # def generate_actual_amortization_schedule(sch_amortizations, actual_amortizations, principal, sch_principals_a_amort):
 #     # getting loan term
 #     term = len(sch_amortizations)
@@ -233,12 +427,22 @@ def generate_actual_amortization_schedule(issue, sch_amortizations, actual_amort
 #     return actual_amortization_schedule, actual_amortizations_dict
 
 
-def generate_principals(face, term, cash_flow, issue):
-    principals_a = {}
-    principals_b = {}
+def generate_principals(face, term, cash_flow, issue, start=0, previous=None):
+    # start and previous: recompute only from period start, reusing the (principals_b, principals_a) previously computed
     principal = face
-    for i in range(term):
-        date_i = issue + relativedelta(months=i + 1)
+    periods = period_calendar(issue, term)
+    if start and previous:
+        principals_b = previous[0].copy()
+        principals_a = previous[1].copy()
+        # replay the balance up to start, so the running (unrounded) principal is the same as in a full pass
+        for i in range(start):
+            principal -= cash_flow[periods[i + 1]]
+    else:
+        start = 0
+        principals_a = {}
+        principals_b = {}
+    for i in range(start, term):
+        date_i = periods[i + 1]
         sch_amort = cash_flow[date_i]
         principal -= sch_amort
         principals_a[date_i] = round(principal, 2)
@@ -246,22 +450,31 @@ def generate_principals(face, term, cash_flow, issue):
     return principals_b , principals_a
 
 
-def generate_interests(cash_flow, rate, comp_period, frequency, issue):
+def generate_interests(cash_flow, rate, comp_period, frequency, issue, start=0, previous=None):
 # def generate_interests(rate, period):
-    interests = {}
+    # start and previous: recompute only from the interest payment period containing start, reusing previous interests
     # calculate monthly rate
     i_m = convert_nominal_to_monthly_effective(rate, comp_period)
     acc_interest = 0
     # calculate months until interest payment
     n = MONTHS[frequency] if (frequency != "at maturity") else len(cash_flow)
-    for i in range(len(cash_flow)):
+    factors = compounding_factors(i_m, n)
+    periods = period_calendar(issue, len(cash_flow))
+    if start and previous:
+        interests = previous.copy()
+        # accrued interest starts over at the beginning of each interest payment period
+        start -= start % n
+    else:
+        start = 0
+        interests = {}
+    for i in range(start, len(cash_flow)):
         # generate monthly periods
-        date_i = issue + relativedelta(months=i + 1)
+        date_i = periods[i + 1]
         # calculate monthly interest
         interest_m = calculate_interest(i_m, cash_flow[date_i])
         # future value of monthly interest at payment date
         comp_periods_i = (n - (i + 1) % n) if (i + 1) % n != 0 else 0
-        fv_interest_m = interest_m * (1 + i_m / 100) ** comp_periods_i
+        fv_interest_m = interest_m * factors[comp_periods_i]
         # accrued interest
         acc_interest += fv_interest_m
         if frequency != "at maturity" and (i + 1) % MONTHS[frequency] == 0:
@@ -274,6 +487,7 @@ def generate_interests(cash_flow, rate, comp_period, frequency, issue):
     return interests
 
 
+@lru_cache(maxsize=RATE_CACHE_SIZE)
 def convert_nominal_to_monthly_effective(rate, comp_period):
     nominal_comp_periods = PERIODS[comp_period]
     # calculate the effective rate according to the compounding periods of nominal rate
@@ -283,6 +497,17 @@ def convert_nominal_to_monthly_effective(rate, comp_period):
     return round(effective_monthly_rate * 100, 4)
 
 
+@lru_cache(maxsize=RATE_CACHE_SIZE)
+def compounding_factors(i_m, n):
+    """
+    Input: i_m, a monthly effective rate in percentage
+    Input: n, the number of months in an interest payment period
+    Returns a tuple with the future value factor (1 + i_m / 100) ** k for k = 0..n. Tables are cached and
+    shared by every loan with the same monthly rate and interest payment period
+    """
+    return tuple((1 + i_m / 100) ** k for k in range(n + 1))
+
+
 def calculate_interest(rate:float, value:float) -> float:
     return round(rate * value / 100, 2)
 
@@ -455,22 +680,54 @@ def cash_flow_report(loan):
     print(tabulate(table, headers, tablefmt="pretty", colalign=("center", "right", "right", "right", "right", "right", "right", "right")))
 
 
-def write_csv_file(path, fields, entries):
-    with open(path, "w") as file:
-        writer = csv.DictWriter(file, fields)
-        writer.writeheader()
-        for entry in entries:
-            att_array = str(entry).split(",")
-            att_dict = dict(zip(fields, att_array))
-            writer.writerow(att_dict)
+def write_csv_file(path, fields, rows):
+    # rows: iterable of tuples with the csv fields of each entry (see the row methods of the models)
+    # written to a temporary file that replaces path once complete: a crash never leaves a truncated file
+    temp = f"{path}.tmp"
+    with open(temp, "w") as file:
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        writer.writerows(rows)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
 
 
-def append_csv_file(path, fields, entry):
-    att_array = str(entry).split(",")
-    att_dict = dict(zip(fields, att_array))
+def file_signature(path):
+    """
+    Input: path, a file
+    Returns a (size, modification time in nanoseconds, sha256 hex digest) tuple identifying the contents of the file
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+def append_journal(path, table, op, entry):
+    """
+    Input: path, the journal file
+    Input: table, the name of the table entry belongs to (banks, loans or amortizations)
+    Input: op, "put" for a created or edited entry, "del" for a deleted one
+    Input: entry, the object
+    Appends one record with the csv fields of entry to the journal
+    """
     with open(path, "a") as file:
-        writer = csv.DictWriter(file, fields)
-        writer.writerow(att_dict)
-    print("Data saved")
+        writer = csv.writer(file)
+        writer.writerow((table, op, *entry.row()))
+
+
+def read_journal(path):
+    """
+    Input: path, the journal file
+    Returns the records of the journal as (table, op, fields) tuples, oldest first. An empty list if there is no journal
+    """
+    try:
+        with open(path) as file:
+            return [(record[0], record[1], record[2:]) for record in csv.reader(file) if len(record) > 2]
+    except FileNotFoundError:
+        return []
 
 
@@ -1,19 +1,38 @@
-import csv
+import atexit
+import os
+import pickle
+import re
 import sys
+from bisect import bisect_left
+from itertools import islice
 from pathlib import Path
 from datetime import datetime, date
-from dateutil.relativedelta import relativedelta
+from threading import Thread
 
-from helpers import MONTHS, PERIODS, TYPES, check_frequency, get_obj, \
-    message_to_figlet, generate_amortizations, generate_interests, generate_principals, \
+import numpy as np
+
+from helpers import MONTHS, PERIODS, TYPES, check_frequency, check_amortization_value, check_amortization_date, get_by_id, add_obj, remove_obj, link_obj, unlink_obj, bank_key, \
+    convert_nominal_to_monthly_effective, maturity_date, affected_period, message_to_figlet, generate_amortizations, generate_interests, generate_principals, \
     calculate_principal_balance, generate_actual_amortization_schedule, loans_report, amort_report, \
-    banks_report, print_frequencies, print_types, print_periods, cash_flow_report, append_csv_file, \
-    write_csv_file
+    banks_report, print_frequencies, print_types, print_periods, cash_flow_report, write_csv_file, \
+    append_journal, read_journal, file_signature, period_calendar
+from engine import AmortizationRow, LoanSchedule, LoanTerms, batch_schedules, parallel_schedules
+from storage import CsvStorage, SqliteStorage
+from columnar import ColumnStore, write_columns
+from cache import ScheduleCache, cache_key
 
 
 banks = []
 amortizations = []
 loans = []
+# id indexes (id -> object), kept in sync with the lists above by add_obj and remove_obj
+banks_by_id = {}
+amortizations_by_id = {}
+loans_by_id = {}
+# bank name index (normalized name -> bank), kept in sync on bank create, rename and delete
+banks_by_name = {}
+# reverse index (bank id -> set of loans), kept in sync on loan create, delete and bank change
+loans_by_bank = {}
 
 LOAN_FIELDS = [
     "id",
@@ -45,15 +64,106 @@ cwd = Path.cwd()
 bank_path = 'data/banks.csv'
 loans_path = 'data/loans.csv'
 amort_path = 'data/amortizations.csv'
+# journal of changes not yet written to the csv files, and the journal being compacted into them
+journal_path = 'data/journal.csv'
+compacting_path = 'data/journal.old.csv'
+# snapshot of the loaded objects and their cash flows, valid while the csv files don't change
+snapshot_path = 'data/snapshot.pickle'
+# memory mapped column files of the amortizations and the computed schedules, read by load_loan
+columns_path = 'data/columns'
+# content addressed cache of computed cash flows, shared by every process running on the same data directory
+cache_path = 'data/cache'
+# sqlite database used when STORAGE is "sqlite" (created from the csv files the first time)
+db_path = 'data/lomap.db'
+# table name -> (csv path, fields)
+TABLES = {
+    "banks": (bank_path, BANK_FIELDS),
+    "loans": (loans_path, LOAN_FIELDS),
+    "amortizations": (amort_path, AMORTIZATION_FIELDS),
+}
+
+# schedule engine: True builds loan schedules with numpy arrays (engine.py), False with the month by month loops (helpers.py)
+VECTORIZED = True
+# schedule evaluation: True computes a loan's cash flows the first time they are read, False computes them right away
+LAZY = True
+# numpy engine arithmetic: True holds money as integer cents (interest accrual and the due amount of the actual
+# schedule stay in floats, see engine.py), False uses floats like helpers.py
+CENTS = False
+# worker processes used by update_loans (0 or 1: compute in this process) and loans sent to a worker at a time
+WORKERS = 0
+CHUNK_SIZE = 1000
+# storage backend: "csv" (data/*.csv files) or "sqlite" (db_path, indexed tables and transactional writes)
+STORAGE = "csv"
+# csv storage: True appends every change to the journal (compacted into the csv files at exit), False rewrites the csv files
+JOURNAL = True
+# journal records that trigger a background compaction (0: only at exit)
+JOURNAL_LIMIT = 1000
+# storage flush policy (csv storage without journal, and sqlite): "immediate" writes every change, "every" writes
+# FLUSH_EVERY changes at once and "exit" writes them when the program ends
+FLUSH = "immediate"
+FLUSH_EVERY = 10
+# loading: True builds the objects straight from the columns of data written by this program, checking each file
+# once with vectorized integrity checks instead of running the property setters row by row
+TRUSTED = False
+# trusted loading of csv storage: worker processes parsing each big csv file in byte ranges (0 or 1: this process)
+PARSE_WORKERS = 0
+# amortizations loading: True reads the amortizations in chunks of STREAM_CHUNK rows, so the whole file is never held
+# in memory. With STREAM_OBJECTS False each amortization is only folded into its loan's balance and period totals
+# (see AmortizationSummary): memory is bounded by the chunk size, and the session is read only
+STREAM = False
+STREAM_CHUNK = 100000
+STREAM_OBJECTS = False
+# csv storage: True starts from the snapshot when the csv files didn't change since it was taken (saved at exit)
+SNAPSHOT = True
+# csv storage: True writes the amortizations and the cash flows computed so far as memory mapped column files at exit
+# (when the csv files changed). While the csv files don't change, the next sessions load only the banks and
+# load_loan reads a loan's amortizations and cash flows from the column files (through their offsets index), so a
+# report on one loan doesn't parse the csv files nor compute the cash flows
+COLUMNAR = False
+# True reads a loan's cash flows from the schedule cache (cache_path) when it already holds the ones of the same
+# terms (and, for the actual ones, the same amortizations and date), and caches the ones computed. The cache is kept
+# under CACHE_SIZE bytes by removing the least recently used entries
+CACHE = False
+CACHE_SIZE = 64 << 20
+
+# journal records written since the last compaction and the thread compacting the journal, if any
+journal_records = 0
+compaction = None
+# changes saved in this session (journal records or storage backend saves)
+saved_entries = 0
+# date of the snapshot the session was restored from, None if it was not restored from a snapshot
+snapshot_date = None
+# storage backend opened by load_data
+storage = None
+# False while loans and amortizations are read from the storage backend as they are looked up (sqlite storage, or
+# csv storage with up to date column files, see load_loan): the lists then hold only the rows read so far, until
+# load_all reads every row
+fully_loaded = True
+# column files loans are read from while not fully loaded (None: sqlite storage, or missing or out of date)
+column_store = None
+# schedule cache opened by open_cache
+schedule_cache = None
+# True when the amortizations were loaded as period totals (STREAM without STREAM_OBJECTS): nothing can be saved
+summarized = False
 
 # Bank class
 
 
 class Bank:
+    __slots__ = ("_id", "_bank")
+
     def __init__(self, id, bank):
         self.id = id
         self.bank = bank
 
+    # already validated data (i.e. data previously written by the program): skips the property setters
+    @classmethod
+    def trusted(cls, id, bank):
+        obj = cls.__new__(cls)
+        obj._id = id
+        obj._bank = bank
+        return obj
+
     # Setting properties
     # id: Can only be set the first time the object is constructed
     @property
@@ -76,15 +186,19 @@ class Bank:
     @bank.setter
     def bank(self, bank):
         # if bank.lower().title() not in banks:
-        if len(banks) != 0 and any(obj.bank == bank.lower().title() for obj in banks):
+        if bank_key(bank) in banks_by_name:
             raise ValueError(
                 "Invalid input: Bank already exists in the database.")
-        self._bank = bank.lower().title()
+        self._bank = bank_key(bank)
 
      # str method: returns csv-like string
     def __str__(self):
         return f"{self.id},{self.bank}"
 
+    # row method: returns the csv fields as a tuple (used by the csv writers and the storage backends)
+    def row(self):
+        return (self.id, self.bank)
+
     def edit(self):
         print("Please enter the following data. At any moment press CTRL + D to go back to the previous menu without saving.")
         # input for bank
@@ -92,31 +206,35 @@ class Bank:
         while True:
             if new_bank := input("Bank: ").lower().title():
                 # if bank already in database:
-                if len(banks) != 0 and any(obj.bank == new_bank.lower().title() for obj in banks):
+                if bank_key(new_bank) in banks_by_name:
                     print(
                         "Invalid input: Bank already exists in the database. Banks in database:")
                     banks_report(banks)
                     continue
                 else:
                     break
-        # Change bank in banks array
+        # Change bank in banks array and in the name index
         self.bank = new_bank
+        del banks_by_name[old_bank]
+        banks_by_name[self.bank] = self
         # # Change bank in every loan in loans array
         # update_object(loans, "bank", old_bank, new_bank)
-        # Writing csv file
-        write_csv_file(cwd / bank_path, BANK_FIELDS, banks)
-        write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+        # Writing csv file (loans.csv stores bank names: rewritten with banks.csv, or when the journal is compacted)
+        if STORAGE == "csv" and not JOURNAL:
+            storage.mark_dirty("loans", loans)
+        save_entry("banks", banks, self, "put")
         print("Data saved")
 
     def delete(self):
         # if bank already in use in loans:
-        if any(obj.bank.bank == self.bank.lower().title() for obj in loans):
+        if self.id in loans_by_bank:
             print("Bank can not be deleted because it has loans associated with it")
         else:
             # delete bank from banks list
-            banks.remove(self)
+            remove_obj(banks, banks_by_id, self)
+            del banks_by_name[self.bank]
             # update csv
-            write_csv_file(cwd / bank_path, BANK_FIELDS, banks)
+            save_entry("banks", banks, self, "del")
             print("Bank deleted")
 
     # def __del__(self):
@@ -137,7 +255,7 @@ class Bank:
         while True:
             if bank := input("Bank: ").lower().title():
                 # if bank already in database:
-                if len(banks) != 0 and any(obj.bank == bank.lower().title() for obj in banks):
+                if bank_key(bank) in banks_by_name:
                     print(
                         "Invalid input: Bank already exists in the database. Banks in database:")
                     banks_report(banks)
@@ -150,6 +268,8 @@ class Bank:
 
 # Amortization class
 class Amortization:
+    __slots__ = ("_id", "_loan_id", "_value", "_amort_date")
+
     def __init__(self, id, loan_id, value, amort_date):
         # , value, date):
         self.id = id
@@ -157,6 +277,26 @@ class Amortization:
         self.value = value
         self.amort_date = amort_date
 
+    # already validated data: id and loan_id ints, value float and amort_date a date. Skips the property setters
+    @classmethod
+    def trusted(cls, id, loan_id, value, amort_date):
+        obj = cls.__new__(cls)
+        obj._id = id
+        obj._loan_id = loan_id
+        obj._value = value
+        obj._amort_date = amort_date
+        return obj
+
+    # csv rows of one loan: the loan, its balance and its date bounds are looked up once for the whole group
+    @classmethod
+    def load_group(cls, loan, rows):
+        balance = loan.principal_balance
+        maturity = maturity_date(loan.issue_date, loan.loan_term)
+        today = date.today()
+        return [cls.trusted(int(row["id"]), loan.id, check_amortization_value(row["value"], balance),
+                            check_amortization_date(row["amort_date"], loan.issue_date, maturity, today))
+                for row in rows]
+
     # Setting properties
     # id: Can only be set the first time the object is constructed
     @property
@@ -179,7 +319,7 @@ class Amortization:
     @loan_id.setter
     def loan_id(self, loan_id):
         # if loan_id not in loans
-        if not any(str(obj.id) == str(loan_id) for obj in loans):
+        if get_by_id(loans_by_id, loan_id) is None:
             raise ValueError(f"No loan with id: {loan_id} in database")
         self._loan_id = int(loan_id)
 
@@ -190,21 +330,8 @@ class Amortization:
 
     @value.setter
     def value(self, value):
-        try:
-            value = float(value)
-            if value < 0:
-                raise ValueError
-        except ValueError:
-            raise ValueError("Amortization value must be a positive number")
-        else:
-            # if value <= 0:
-            #     raise ValueError("Amortization value must be a positive number")
-            loan = get_obj(loans, self.loan_id, "id")
-            loan_principal_balance = loan.principal_balance
-            if value > loan_principal_balance:
-                raise ValueError(
-                    f"Amortization value (${value:,.2f}) can not be greater than loan balance (${loan_principal_balance:,.2f})")
-            self._value = value
+        loan = get_by_id(loans_by_id, self.loan_id)
+        self._value = check_amortization_value(value, loan.principal_balance)
 
     # amort_date: must be a valid date and between issue date and date at maturity
     @property
@@ -213,28 +340,18 @@ class Amortization:
 
     @amort_date.setter
     def amort_date(self, amort_date):
-        if not isinstance(amort_date, date):
-            try:
-                amort_date = datetime.strptime(amort_date, '%Y-%m-%d').date()
-            except ValueError:
-                print("Invalid date format, should be YYYY-MM-DD")
-        loan = get_obj(loans, self.loan_id, "id")
-        loan_issue_date = loan.issue_date
-        loan_term = loan.loan_term
-        loan_maturity = loan_issue_date + relativedelta(months=loan_term)
-        today = date.today()
-        if not amort_date <= today:
-            raise ValueError(
-                f"Amortization date ({str(amort_date)}) can not be greater than today ({str(today)})")
-        if not loan_issue_date < amort_date <= loan_maturity:
-            raise ValueError(
-                f"Amortization date ({str(amort_date)}) can not be less than or equal to loan issue date ({str(loan_issue_date)}) and can not be greater than loan maturity date ({str(loan_maturity)})")
-        self._amort_date = amort_date
+        loan = get_by_id(loans_by_id, self.loan_id)
+        self._amort_date = check_amortization_date(
+            amort_date, loan.issue_date, maturity_date(loan.issue_date, loan.loan_term), date.today())
 
      # str method: returns csv-like string
     def __str__(self):
         return f"{self.id},{self.loan_id},{self.value},{str(self.amort_date)}"
 
+    # row method: returns the csv fields as a tuple (used by the csv writers and the storage backends)
+    def row(self):
+        return (self.id, self.loan_id, self.value, str(self.amort_date))
+
     # adding 2 amortizations or 1 amortization plus a float
     # self + other
     def __add__(self, other):
@@ -273,7 +390,7 @@ class Amortization:
                                 "Invalid input: Amortization value must be a positive number")
                             continue
                         else:
-                            loan = get_obj(loans, self.loan_id, "id")
+                            loan = get_by_id(loans_by_id, self.loan_id)
                             loan_principal_balance = loan.principal_balance
                             if new_value > loan_principal_balance + old_value:
                                 print(f"Amortization value (${new_value:,.2f}) must be less than or equal to loan balance plus",
@@ -285,9 +402,8 @@ class Amortization:
                 self.value = 0
                 loan.update_balance()
                 self.value = new_value
-                write_csv_file(cwd / amort_path,
-                               AMORTIZATION_FIELDS, amortizations)
-                loan.update_act()
+                save_entry("amortizations", amortizations, self, "put")
+                loan.update_act(self.amort_date)
                 print("Data saved")
                 break
             elif option == "a":
@@ -301,11 +417,10 @@ class Amortization:
                             print("Invalid date format, should be YYYY-MM-DD")
                             continue
                         else:
-                            loan = get_obj(loans, self.loan_id, "id")
+                            loan = get_by_id(loans_by_id, self.loan_id)
                             loan_issue_date = loan.issue_date
                             loan_term = loan.loan_term
-                            loan_maturity = loan_issue_date + \
-                                relativedelta(months=loan_term)
+                            loan_maturity = maturity_date(loan_issue_date, loan_term)
                             today = date.today()
                             if not new_date <= today:
                                 print(
@@ -318,10 +433,10 @@ class Amortization:
                             else:
                                 break
                 # Change amort in amortizations array
+                old_date = self.amort_date
                 self.amort_date = new_date
-                write_csv_file(cwd / amort_path,
-                               AMORTIZATION_FIELDS, amortizations)
-                loan.update_act()
+                save_entry("amortizations", amortizations, self, "put")
+                loan.update_act(min(old_date, new_date))
                 print("Data saved")
                 break
             else:
@@ -332,13 +447,13 @@ class Amortization:
     def delete(self):
         # delete amortization in loan
         # get loan based on amortization.loan_id and add amortization
-        loan = get_obj(loans, int(self.loan_id), "id")
+        loan = get_by_id(loans_by_id, self.loan_id)
         loan.actual_amortizations.remove(self)
-        loan.update_act()
+        loan.update_act(self.amort_date)
         # delete amortization itself
-        amortizations.remove(self)
+        remove_obj(amortizations, amortizations_by_id, self)
         # update csv
-        write_csv_file(cwd / amort_path, AMORTIZATION_FIELDS, amortizations)
+        save_entry("amortizations", amortizations, self, "del")
         print("Amortization deleted")
 
     # def __del__(self):
@@ -360,7 +475,7 @@ class Amortization:
             while True:
                 if loan_id := input("Loan id: "):
                     # if loan_id not in loans
-                    if not any(str(obj.id) == str(loan_id) for obj in loans):
+                    if get_by_id(loans_by_id, loan_id) is None:
                         print(
                             f"Invalid input: No loan with id: {loan_id} in database. Please enter one of the following loan ids:")
                         # for obj in loans:
@@ -382,7 +497,7 @@ class Amortization:
                             "Invalid input: Amortization value must be a positive number")
                         continue
                     else:
-                        loan = get_obj(loans, loan_id, "id")
+                        loan = get_by_id(loans_by_id, loan_id)
                         loan_principal_balance = loan.principal_balance
                         if value > loan_principal_balance:
                             print(
@@ -400,11 +515,10 @@ class Amortization:
                         print("Invalid date format, should be YYYY-MM-DD")
                         continue
                     else:
-                        loan = get_obj(loans, loan_id, "id")
+                        loan = get_by_id(loans_by_id, loan_id)
                         loan_issue_date = loan.issue_date
                         loan_term = loan.loan_term
-                        loan_maturity = loan_issue_date + \
-                            relativedelta(months=loan_term)
+                        loan_maturity = maturity_date(loan_issue_date, loan_term)
                         today = date.today()
                         if not amort_date <= today:
                             print(
@@ -421,8 +535,36 @@ class Amortization:
             print("No loans have been created yet. Amortizations can not be registered")
 
 
+# Amortizations of one loan folded into period totals, for loading without keeping an object per amortization
+class AmortizationSummary:
+    __slots__ = ("boundaries", "buckets", "total", "count")
+
+    def __init__(self, issue, term):
+        self.boundaries = period_calendar(issue, term)
+        # period date -> sum of the amortizations made in the period, in loading order
+        self.buckets = {}
+        # sum of every amortization, in loading order (the same additions calculate_principal_balance makes)
+        self.total = 0
+        self.count = 0
+
+    def add(self, amortization):
+        period = self.boundaries[bisect_left(self.boundaries, amortization.amort_date)]
+        self.buckets[period] = self.buckets.get(period, 0) + amortization.value
+        self.total += amortization.value
+        self.count += 1
+
+    def rows(self):
+        # one amortization per period, dated at the end of the period: bucketed again into the same periods
+        return [AmortizationRow(period, value) for period, value in sorted(self.buckets.items())]
+
+
 # Loan class
 class Loan:
+    __slots__ = ("_id", "_face_value", "_bank", "_issue_date", "_loan_term", "_payment_frequency", "_interest_rate",
+                 "_interest_rate_type", "_nominal_rate_compounding_period", "_interest_payment_frequency",
+                 "principal_balance", "actual_amortizations", "amortization_summary", "_sch_dirty", "_act_dirty",
+                 "_act_since", "_schedule")
+
     def __init__(self, id, face_value, bank, issue_date, loan_term, payment_frequency, interest_rate, interest_rate_type,
                  nominal_rate_compounding_period, interest_payment_frequency):
         # Loaded input or user's input
@@ -436,29 +578,43 @@ class Loan:
         self.interest_rate_type = interest_rate_type
         self.nominal_rate_compounding_period = nominal_rate_compounding_period
         self.interest_payment_frequency = interest_payment_frequency
+        self.init_cash_flows()
 
+    # already validated data: bank a Bank object, issue_date a date and numbers already converted. Skips the property setters
+    @classmethod
+    def trusted(cls, id, face_value, bank, issue_date, loan_term, payment_frequency, interest_rate, interest_rate_type,
+                nominal_rate_compounding_period, interest_payment_frequency):
+        obj = cls.__new__(cls)
+        obj._id = id
+        obj._face_value = face_value
+        obj._bank = bank
+        obj._issue_date = issue_date
+        obj._loan_term = loan_term
+        obj._payment_frequency = payment_frequency
+        obj._interest_rate = interest_rate
+        obj._interest_rate_type = interest_rate_type
+        obj._nominal_rate_compounding_period = nominal_rate_compounding_period
+        obj._interest_payment_frequency = interest_payment_frequency
+        obj.init_cash_flows()
+        return obj
+
+    def init_cash_flows(self):
         # additional information
         # at moment of creation or at moment of editing loans. "Loan scheme"
         self.principal_balance = self.face_value
-        # Dictionary where keys are dates and values are scheduled amortizations
-        self.amort_schedule = {}
-        self.scheduled_principals_b_amort = {}
-        # Dictionaries where keys are dates and values are principals in each period before and after amortization
-        self.scheduled_principals_a_amort = {}
-        # Dictionary where keys are dates anda values are scheduled interest payments
-        self.interest_payment_schedule = {}
+        # Cash flows are computed when first read (see the properties below). Dirty flags tell whether
+        # the scheduled and the actual cash flows must be computed again
+        self._sch_dirty = True
+        self._act_dirty = True
+        # date of the earliest amortization changed since the actual cash flow was computed (None: recompute all)
+        self._act_since = None
+        # LoanSchedule holding every cash flow column of the loan (see engine.py)
+        self._schedule = None
 
         # amortizations and future cash flow based on actual amortizations
         self.actual_amortizations = []  # List containing amortization objects for this loan
-        # Dict containing amortizations for later reports
-        self.actual_amortizations_dict = {}
-        # Similar to amort_schedule, but takes into account actual amortizations
-        self.actual_amort_schedule = self.amort_schedule
-        # interest
-        # Similar to interest_payment_schedule but takes into account actual amortizations
-        self.actual_interest_payment_schedule = self.interest_payment_schedule
-        self.actual_principals_b_amort = self.scheduled_principals_b_amort
-        self.actual_principals_a_amort = self.scheduled_principals_a_amort
+        # amortizations loaded as period totals (see AmortizationSummary), None when every amortization is an object
+        self.amortization_summary = None
 
     # Setting properties
     # id: Can only be set the first time the object is constructed
@@ -501,11 +657,9 @@ class Loan:
     @bank.setter
     def bank(self, bank):
         # if bank.lower().title() not in banks:
-        if not any(obj.bank == bank.lower().title() for obj in banks):
+        if (bank := banks_by_name.get(bank_key(bank))) is None:
             raise ValueError(
                 "Invalid input: Bank does not exist in the database.")
-        # self._bank = bank.lower().title()
-        bank = get_obj(banks, bank.lower().title(), "bank")
         self._bank = bank
 
     # issue_date: must be a valid date
@@ -625,51 +779,229 @@ class Loan:
                     f"Interest payment frequency and loan term does not match. Loan term ({self.loan_term}) not divisible by months in {interest_payment_frequency} frequency ({period})")
         self._interest_payment_frequency = interest_payment_frequency
 
+    # Cash flows: computed on first access while dirty. Each one is a date-keyed view of a LoanSchedule column
+    # scheduled cash flow
+    # Dictionary where keys are dates and values are scheduled amortizations
+    @property
+    def amort_schedule(self):
+        if self._sch_dirty:
+            self.calculate_sch()
+        return self._schedule.column("amort_schedule")
+
+    # Dictionaries where keys are dates and values are principals in each period before and after amortization
+    @property
+    def scheduled_principals_b_amort(self):
+        if self._sch_dirty:
+            self.calculate_sch()
+        return self._schedule.column("scheduled_principals_b_amort")
+
+    @property
+    def scheduled_principals_a_amort(self):
+        if self._sch_dirty:
+            self.calculate_sch()
+        return self._schedule.column("scheduled_principals_a_amort")
+
+    # Dictionary where keys are dates anda values are scheduled interest payments
+    @property
+    def interest_payment_schedule(self):
+        if self._sch_dirty:
+            self.calculate_sch()
+        return self._schedule.column("interest_payment_schedule")
+
+    # actual cash flow
+    # Dict containing amortizations for later reports
+    @property
+    def actual_amortizations_dict(self):
+        if self._act_dirty:
+            self.calculate_act()
+        return self._schedule.column("actual_amortizations_dict")
+
+    # Similar to amort_schedule, but takes into account actual amortizations
+    @property
+    def actual_amort_schedule(self):
+        if self._act_dirty:
+            self.calculate_act()
+        return self._schedule.column("actual_amort_schedule")
+
+    @property
+    def actual_principals_b_amort(self):
+        if self._act_dirty:
+            self.calculate_act()
+        return self._schedule.column("actual_principals_b_amort")
+
+    @property
+    def actual_principals_a_amort(self):
+        if self._act_dirty:
+            self.calculate_act()
+        return self._schedule.column("actual_principals_a_amort")
+
+    # Similar to interest_payment_schedule but takes into account actual amortizations
+    @property
+    def actual_interest_payment_schedule(self):
+        if self._act_dirty:
+            self.calculate_act()
+        return self._schedule.column("actual_interest_payment_schedule")
+
     # METHODS
     # str method: returns csv-like string
     def __str__(self):
         return f"{self.id},{self.face_value},{self.bank.bank},{str(self.issue_date)},{self.loan_term},{self.payment_frequency},{self.interest_rate},{self.interest_rate_type},{self.nominal_rate_compounding_period},{self.interest_payment_frequency}"
 
+    # row method: returns the csv fields as a tuple (used by the csv writers and the storage backends)
+    def row(self):
+        return (self.id, self.face_value, self.bank.bank, str(self.issue_date), self.loan_term, self.payment_frequency,
+                self.interest_rate, self.interest_rate_type, self.nominal_rate_compounding_period,
+                self.interest_payment_frequency)
+
     # add amortization method
 
     def add_amortization(self, amortization):
         # add amortization an update balance
         self.actual_amortizations.append(amortization)
 
-    # Updating scheduled cash flow
+    def add_amortizations(self, amortizations):
+        # add every amortization of a group at once (loading)
+        self.actual_amortizations.extend(amortizations)
 
-    def update_sch(self):
-        self.calculate_amort_schedule()
-        self.calculate_principals()
-        self.calculate_interest_payment_schedule()
+    def fold_amortizations(self, amortizations):
+        # add a group of amortizations to the period totals only (streamed loading)
+        if self.amortization_summary is None:
+            self.amortization_summary = AmortizationSummary(self.issue_date, self.loan_term)
+        for amortization in amortizations:
+            self.amortization_summary.add(amortization)
 
-    # Updating future (actual) cash flow based on actual amortizations
+    def schedule_amortizations(self):
+        # amortizations the actual cash flow is computed from: the period totals, if any, then the objects
+        if self.amortization_summary is None:
+            return self.actual_amortizations
+        return self.amortization_summary.rows() + self.actual_amortizations
 
-    def update_act(self):
-        # if len(self.actual_amortizations) != 0:
-        self.update_balance()
-        self.actual_amort_schedule, self.actual_amortizations_dict = generate_actual_amortization_schedule(
-            self.issue_date, self.amort_schedule, self.actual_amortizations, self.principal_balance, self.scheduled_principals_a_amort)
-        self.actual_principals_b_amort, self.actual_principals_a_amort = generate_principals(self.face_value,
-                                                                                             self.loan_term, self.actual_amort_schedule, self.issue_date)
-        self.actual_interest_payment_schedule = generate_interests(self.actual_principals_b_amort, self.interest_rate,
-                                                                   self.nominal_rate_compounding_period, self.interest_payment_frequency, self.issue_date)
+    # Updating scheduled cash flow: marks it (and the actual cash flow, which depends on it) dirty
 
-    def calculate_amort_schedule(self):
-        self.amort_schedule = generate_amortizations(
-            self.face_value, self.loan_term, self.issue_date, self.payment_frequency)
+    def update_sch(self):
+        self._sch_dirty = True
+        self._act_dirty = True
+        self._act_since = None
+        if not LAZY:
+            self.calculate_sch()
 
-    def calculate_interest_payment_schedule(self):
-        self.interest_payment_schedule = generate_interests(self.scheduled_principals_b_amort, self.interest_rate,
-                                                            self.nominal_rate_compounding_period, self.interest_payment_frequency, self.issue_date)
+    # Updating future (actual) cash flow based on actual amortizations: updates the balance and marks the actual cash flow dirty
 
-    def calculate_principals(self):
-        self.scheduled_principals_b_amort, self.scheduled_principals_a_amort = generate_principals(self.face_value,
-                                                                                                   self.loan_term, self.amort_schedule, self.issue_date)
+    def update_act(self, since=None):
+        # since: date of a new, edited or deleted amortization. Periods before it are reused and only
+        # the periods from the first affected one onwards are recomputed
+        # if len(self.actual_amortizations) != 0:
+        self.update_balance()
+        if self._act_dirty and (since is None or self._act_since is None):
+            self._act_since = None
+        elif self._act_dirty:
+            self._act_since = min(self._act_since, since)
+        else:
+            self._act_since = since
+        self._act_dirty = True
+        if not LAZY:
+            self.calculate_act()
+
+    def terms(self):
+        # everything the cash flows depend on, for computing them outside the loan (see update_loans)
+        return LoanTerms(self.face_value, self.issue_date, self.loan_term, self.payment_frequency,
+                         convert_nominal_to_monthly_effective(self.interest_rate, self.nominal_rate_compounding_period),
+                         self.interest_payment_frequency, self.principal_balance, self.schedule_amortizations())
+
+    def cache_keys(self):
+        # keys of the scheduled and the actual cash flows in the schedule cache: the scheduled ones depend on the
+        # engine and the terms only, the actual ones also on the balance, the amortizations and today's date
+        scheduled = cache_key(VECTORIZED, CENTS, self.face_value, self.issue_date, self.loan_term,
+                              self.payment_frequency, self.interest_rate, self.nominal_rate_compounding_period,
+                              self.interest_payment_frequency)
+        amortizations = tuple((amort.amort_date, amort.value) for amort in self.schedule_amortizations())
+        return scheduled, cache_key(scheduled, self.principal_balance, amortizations, date.today())
+
+    def set_schedule(self, schedule):
+        # cash flows computed elsewhere (i.e. update_loans)
+        self._schedule = schedule
+        self._sch_dirty = False
+        self._act_dirty = False
+        self._act_since = None
+
+    def computed_schedule(self):
+        # the LoanSchedule if every cash flow is computed, otherwise None (i.e. for writing it out, see save_columns)
+        return None if self._act_dirty else self._schedule
+
+    def calculate_sch(self):
+        self._sch_dirty = False
+        # a new schedule: issue date or term may have changed
+        schedule = LoanSchedule(self.issue_date, self.loan_term)
+        if (cache := open_cache()) is not None:
+            key = self.cache_keys()[0]
+            if (values := cache.get(key)) is not None:
+                schedule.scheduled = values
+                self._schedule = schedule
+                return
+        if VECTORIZED:
+            i_m = convert_nominal_to_monthly_effective(self.interest_rate, self.nominal_rate_compounding_period)
+            schedule.calculate_scheduled(self.face_value, self.payment_frequency, i_m, self.interest_payment_frequency, CENTS)
+        else:
+            amort_schedule = generate_amortizations(
+                self.face_value, self.loan_term, self.issue_date, self.payment_frequency)
+            principals_b, principals_a = generate_principals(
+                self.face_value, self.loan_term, amort_schedule, self.issue_date)
+            interests = generate_interests(principals_b, self.interest_rate, self.nominal_rate_compounding_period,
+                                           self.interest_payment_frequency, self.issue_date)
+            schedule.set_column("amort_schedule", amort_schedule)
+            schedule.set_column("scheduled_principals_b_amort", principals_b)
+            schedule.set_column("scheduled_principals_a_amort", principals_a)
+            schedule.set_column("interest_payment_schedule", interests)
+        self._schedule = schedule
+        if cache is not None:
+            cache.put(key, schedule.scheduled)
+
+    def calculate_act(self):
+        if self._sch_dirty:
+            self.calculate_sch()
+        since = self._act_since
+        self._act_dirty = False
+        self._act_since = None
+        start = 0
+        if since is not None:
+            start = affected_period(self.issue_date, self.loan_term, since)
+        schedule = self._schedule
+        if (cache := open_cache()) is not None:
+            key = self.cache_keys()[1]
+            if (values := cache.get(key)) is not None:
+                schedule.actual[:] = values
+                return
+        actual_amort_schedule, actual_amortizations_dict = generate_actual_amortization_schedule(
+            self.issue_date, schedule.column("amort_schedule"), self.schedule_amortizations(), self.principal_balance,
+            schedule.column("scheduled_principals_a_amort"), start,
+            (schedule.column("actual_amort_schedule"), schedule.column("actual_amortizations_dict")))
+        schedule.set_column("actual_amort_schedule", actual_amort_schedule)
+        schedule.set_column("actual_amortizations_dict", actual_amortizations_dict)
+        if VECTORIZED:
+            i_m = convert_nominal_to_monthly_effective(self.interest_rate, self.nominal_rate_compounding_period)
+            schedule.calculate_actual(self.face_value, i_m, self.interest_payment_frequency, start, CENTS)
+        else:
+            principals_b, principals_a = generate_principals(
+                self.face_value, self.loan_term, schedule.column("actual_amort_schedule"), self.issue_date, start,
+                (schedule.column("actual_principals_b_amort"), schedule.column("actual_principals_a_amort")))
+            schedule.set_column("actual_principals_b_amort", principals_b)
+            schedule.set_column("actual_principals_a_amort", principals_a)
+            interests = generate_interests(principals_b, self.interest_rate, self.nominal_rate_compounding_period,
+                                           self.interest_payment_frequency, self.issue_date, start,
+                                           schedule.column("actual_interest_payment_schedule"))
+            schedule.set_column("actual_interest_payment_schedule", interests)
+        if cache is not None:
+            cache.put(key, schedule.actual)
 
     def update_balance(self):
-        self.principal_balance = calculate_principal_balance(
-            self.face_value, self.actual_amortizations)
+        if self.amortization_summary is None:
+            self.principal_balance = calculate_principal_balance(
+                self.face_value, self.actual_amortizations)
+        else:
+            total = self.amortization_summary.total
+            for amortization in self.actual_amortizations:
+                total += amortization.value
+            self.principal_balance = self.face_value - total
 
     def edit(self):
         while True:
@@ -697,7 +1029,7 @@ class Loan:
                                 break
                 # Change loan in loans array
                 self.face_value = new_face_value
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                save_entry("loans", loans, self, "put")
                 self.update_sch()
                 self.update_act()
                 print("Data saved")
@@ -707,16 +1039,18 @@ class Loan:
                 # old_date = self.amort_date
                 while True:
                     if new_bank := input("Bank: ").lower().title():
-                        if not any(obj.bank == new_bank.lower().title() for obj in banks):
+                        if bank_key(new_bank) not in banks_by_name:
                             print(
                                 "Invalid input: Bank does not exist in the database. Please enter one of the following banks:")
                             banks_report(banks)
                             continue
                         else:
                             break
-                # Change loan in loans array
+                # Change loan in loans array and move it to the new bank's loans
+                unlink_obj(loans_by_bank, self.bank.id, self)
                 self.bank = new_bank
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                link_obj(loans_by_bank, self.bank.id, self)
+                save_entry("loans", loans, self, "put")
                 print("Data saved")
                 break
             # input for issue date
@@ -738,8 +1072,7 @@ class Loan:
                                     self.actual_amortizations, key=lambda x: x.amort_date).amort_date
                                 max_amort_date = max(
                                     self.actual_amortizations, key=lambda x: x.amort_date).amort_date
-                                new_maturity_date = new_issue_date + \
-                                    relativedelta(months=self.loan_term)
+                                new_maturity_date = maturity_date(new_issue_date, self.loan_term)
                                 if new_issue_date >= min_amort_date:
                                     print(
                                         f"Issue date ({str(new_issue_date)}) can not be greater than or equal to min amortization date ({str(min_amort_date)})")
@@ -756,7 +1089,7 @@ class Loan:
                 self.issue_date = new_issue_date
                 self.update_sch()
                 self.update_act()
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                save_entry("loans", loans, self, "put")
                 print("Data saved")
                 break
             # input for term
@@ -778,8 +1111,7 @@ class Loan:
                                 # checking actual amortization dates
                                 max_amort_date = max(
                                     self.actual_amortizations, key=lambda x: x.amort_date).amort_date
-                                new_maturity_date = self.issue_date + \
-                                    relativedelta(months=new_loan_term)
+                                new_maturity_date = maturity_date(self.issue_date, new_loan_term)
                                 if new_maturity_date < max_amort_date:
                                     print(
                                         f"Loan issue date ({self.issue_date}) plus new loan term ({new_loan_term}) yields a new loan maturity date ({str(new_maturity_date)}) that is lesser than max amortization date ({str(max_amort_date)})")
@@ -799,7 +1131,7 @@ class Loan:
                 self.loan_term = new_loan_term
                 self.update_sch()
                 self.update_act()
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                save_entry("loans", loans, self, "put")
                 print("Data saved")
                 break
             # input for payment frequency
@@ -824,7 +1156,7 @@ class Loan:
                 self.payment_frequency = new_payment_frequency
                 self.update_sch()
                 self.update_act()
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                save_entry("loans", loans, self, "put")
                 print("Data saved")
                 break
             # input for interest payment frequency
@@ -849,7 +1181,7 @@ class Loan:
                 self.interest_payment_frequency = new_interest_payment_frequency
                 self.update_sch()
                 self.update_act()
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                save_entry("loans", loans, self, "put")
                 print("Data saved")
                 break
             # input for interest rate
@@ -871,7 +1203,7 @@ class Loan:
                 self.interest_rate = new_interest_rate
                 self.update_sch()
                 self.update_act()
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                save_entry("loans", loans, self, "put")
                 print("Data saved")
                 break
            # input for interest rate type and nominal rate compounding period
@@ -910,7 +1242,7 @@ class Loan:
                 self.nominal_rate_compounding_period = new_nominal_rate_compounding_period
                 self.update_sch()
                 self.update_act()
-                write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+                save_entry("loans", loans, self, "put")
                 print("Data saved")
                 break
             else:
@@ -926,9 +1258,10 @@ class Loan:
                 "Loan can not be deleted because it has amortizations associated with it")
         else:
             # delete loan from loans list
-            loans.remove(self)
+            remove_obj(loans, loans_by_id, self)
+            unlink_obj(loans_by_bank, self.bank.id, self)
             # update csv
-            write_csv_file(cwd / loans_path, LOAN_FIELDS, loans)
+            save_entry("loans", loans, self, "del")
             print("Loan deleted")
 
     # def __del__(self):
@@ -962,7 +1295,7 @@ class Loan:
             while True:
                 if bank := input("Bank: ").lower().title():
                     # if bank not in banks:
-                    if not any(obj.bank == bank.lower().title() for obj in banks):
+                    if bank_key(bank) not in banks_by_name:
                         print(
                             "Invalid input: Bank does not exist in the database. Please enter one of the following banks:")
                         banks_report(banks)
@@ -1077,36 +1410,656 @@ def main():
     # Welcome message with figlet library
     message_to_figlet('Welcome to loMap', 'doom')
     print("-" * 56)
-    # Loading data into memory
-    # reading banks.csv
-    with open(cwd / bank_path) as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            banks.append(Bank(**row))
-    # reading loans.csv
-    with open(cwd / loans_path) as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            loans.append(Loan(**row))
-    # reading amortizations.csv
-    with open(cwd / amort_path) as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # create amortization object, add amortization to amortization lists and add amortization to the loan object
-            amortization = Amortization(**row)
-            amortizations.append(amortization)
-            loan = get_obj(loans, int(row["loan_id"]), "id")
-            loan.add_amortization(amortization)
-    # Updating loan attributes once all data has ben loaded: for better performance
-    for loan in loans:
-        loan.update_sch()
-        loan.update_act()
+    load_data()
+    # the journal is written back into the csv files when the program ends, then the snapshot and the column files
+    # are taken
+    # (exit functions run last registered first)
+    atexit.register(save_columns)
+    atexit.register(save_snapshot)
+    atexit.register(compact_journal)
+    atexit.register(storage.close)
     # Main Menu
     menu("main")
     for loan in Loans:
         print(loan)
 
 
+def open_cache():
+    """
+    Returns the schedule cache (opened the first time it is used), None if CACHE is off
+    """
+    global schedule_cache
+    if not CACHE:
+        return None
+    if schedule_cache is None:
+        schedule_cache = ScheduleCache(cwd / cache_path, CACHE_SIZE)
+    return schedule_cache
+
+
+def open_storage():
+    """
+    Returns the storage backend selected by STORAGE. The sqlite database is filled from the csv files when it is
+    created, and only then
+    """
+    if STORAGE == "sqlite":
+        return SqliteStorage(cwd / db_path, TABLES, FLUSH, FLUSH_EVERY, CsvStorage(cwd, TABLES))
+    return CsvStorage(cwd, TABLES, FLUSH, FLUSH_EVERY, PARSE_WORKERS)
+
+
+def load_data():
+    """
+    Opens the storage backend and loads banks, loans and amortizations from it. With sqlite storage, or csv storage
+    with up to date column files, only the banks are loaded: a loan is read with its amortizations when it is looked
+    up (see load_loan), and load_all reads the rest when the whole portfolio is needed
+    """
+    global storage, fully_loaded, column_store
+    storage = open_storage()
+    if STORAGE == "sqlite" or (column_store := open_columns()) is not None:
+        load_banks()
+        fully_loaded = False
+        return
+    load_rows()
+
+
+def load_all():
+    """
+    Loads every row of the storage backend if only some loans were read so far (see fully_loaded). The objects read
+    so far are replaced: their changes are already in the storage backend
+    """
+    global fully_loaded
+    if fully_loaded:
+        return
+    for entries in (banks, loans, amortizations):
+        entries.clear()
+    for index in (banks_by_id, banks_by_name, loans_by_id, loans_by_bank, amortizations_by_id):
+        index.clear()
+    fully_loaded = True
+    load_rows()
+
+
+def has_rows(table, entries):
+    """
+    Input: table, the name of a table (banks, loans or amortizations)
+    Input: entries, the list of objects of the table
+    Returns True if the table has rows, in memory or, while not fully loaded, in the storage backend
+    """
+    return len(entries) != 0 or (not fully_loaded and storage.has_rows(table))
+
+
+def load_rows():
+    """
+    Loads banks, loans and amortizations from the storage backend and computes every loan's cash flows
+    """
+    if load_snapshot():
+        return
+    # streaming needs the csv files to be up to date: a journal left to replay could edit folded amortizations
+    stream = STREAM and not (STORAGE == "csv" and ((cwd / journal_path).exists() or (cwd / compacting_path).exists()))
+    if TRUSTED:
+        load_trusted(not stream)
+    else:
+        load_validated(not stream)
+    if stream:
+        load_streamed()
+    # changes made after the csv files were last written (a compaction cut short is replayed first)
+    if STORAGE == "csv":
+        replay_journal(cwd / compacting_path)
+        replay_journal(cwd / journal_path)
+        if not JOURNAL:
+            compact_journal()
+    # Updating loan attributes once all data has ben loaded: for better performance
+    # lazy loans only update their balance here, cash flows are computed when a report reads them
+    if VECTORIZED and not LAZY:
+        update_loans(loans)
+    else:
+        for loan in loans:
+            loan.update_sch()
+            loan.update_act()
+
+
+def load_validated(with_amortizations=True):
+    """
+    Input: with_amortizations, False to load banks and loans only
+    Loads banks, loans and amortizations from the storage backend, validating every field through the property setters
+    """
+    load_banks()
+    # reading loans
+    for row in storage.rows("loans"):
+        loan = Loan(**row)
+        add_obj(loans, loans_by_id, loan)
+        link_obj(loans_by_bank, loan.bank.id, loan)
+    # reading amortizations
+    if with_amortizations:
+        add_amortization_rows(list(storage.rows("amortizations")))
+
+
+def load_banks():
+    """
+    Loads the banks from the storage backend, validating every field through the property setters
+    """
+    for row in storage.rows("banks"):
+        bank = Bank(**row)
+        add_obj(banks, banks_by_id, bank)
+        banks_by_name[bank.bank] = bank
+
+
+def add_amortization_rows(rows):
+    """
+    Input: rows, a list of amortization rows (dicts)
+    Validates the rows loan by loan and adds the amortizations to their loans and to the amortizations list
+    """
+    # grouping the rows by loan: each loan is looked up once and gets its amortizations in bulk
+    for positions, loan, group in amortization_groups(rows):
+        loan.add_amortizations(group)
+        for i, amortization in zip(positions, group):
+            rows[i] = amortization
+    # amortizations list keeps the csv order (new ids are assigned after the last one)
+    for amortization in rows:
+        add_obj(amortizations, amortizations_by_id, amortization)
+
+
+def amortization_groups(rows):
+    """
+    Input: rows, a list of amortization rows (dicts)
+    Returns a list of (positions, loan, amortizations) tuples: the rows of each loan, validated together against the loan
+    """
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(row["loan_id"], []).append(i)
+    validated = []
+    for loan_id, positions in groups.items():
+        if (loan := get_by_id(loans_by_id, loan_id)) is None:
+            raise ValueError(f"No loan with id: {loan_id} in database")
+        validated.append((positions, loan, Amortization.load_group(loan, [rows[i] for i in positions])))
+    return validated
+
+
+def load_streamed():
+    """
+    Loads the amortizations in chunks of STREAM_CHUNK rows. With STREAM_OBJECTS False the amortizations of each chunk
+    are folded into their loans' period totals and dropped, and the session becomes read only
+    """
+    global summarized
+    summarized = not STREAM_OBJECTS
+    rows = storage.rows("amortizations")
+    while chunk := list(islice(rows, STREAM_CHUNK)):
+        if STREAM_OBJECTS:
+            add_amortization_rows(chunk)
+        else:
+            for positions, loan, group in amortization_groups(chunk):
+                loan.fold_amortizations(group)
+
+
+def load_trusted(with_amortizations=True):
+    """
+    Input: with_amortizations, False to load banks and loans only
+    Loads banks, loans and amortizations written by this program without running the property setters. Each table is
+    parsed in columns and checked with one vectorized integrity check per rule (same rules as the setters), then
+    the objects are built with the trusted constructors
+    """
+    # banks
+    columns = storage.columns("banks", BANK_FIELDS)
+    ids = np.array(columns["id"], dtype=np.int64)
+    names = [bank_key(name) for name in columns["bank"]]
+    check_rows("banks", ids, first_occurrences(ids), "duplicated id")
+    check_rows("banks", ids, first_occurrences(names), "bank already exists in the database")
+    for id, name in zip(ids.tolist(), names):
+        bank = Bank.trusted(id, name)
+        add_obj(banks, banks_by_id, bank)
+        banks_by_name[bank.bank] = bank
+
+    # loans
+    columns = storage.columns("loans", LOAN_FIELDS)
+    ids = np.array(columns["id"], dtype=np.int64)
+    faces = np.array(columns["face_value"], dtype=float)
+    terms = np.array(columns["loan_term"], dtype=float)
+    rates = np.array(columns["interest_rate"], dtype=float)
+    loan_banks = [banks_by_name.get(bank_key(name)) for name in columns["bank"]]
+    types = np.array([rate_type.lower() for rate_type in columns["interest_rate_type"]])
+    periods = np.array([period.lower() for period in columns["nominal_rate_compounding_period"]])
+    check_rows("loans", ids, first_occurrences(ids), "duplicated id")
+    check_rows("loans", ids, faces > 0, "face value must be a positive number")
+    check_rows("loans", ids, (terms > 0) & (terms % 1 == 0), "loan term must be a positive integer")
+    check_rows("loans", ids, (rates > 0) & (rates <= 100), "interest rate must be between 0 and 100")
+    check_rows("loans", ids, np.array([bank is not None for bank in loan_banks], dtype=bool),
+               "bank does not exist in the database")
+    check_rows("loans", ids, np.isin(types, TYPES), "rate type does not exist in the database")
+    check_rows("loans", ids, np.isin(periods, list(PERIODS)) & ~((types == "nominal") & (periods == "annually")),
+               "invalid nominal rate compounding period")
+    terms = terms.astype(np.int64)
+    for field in ("payment_frequency", "interest_payment_frequency"):
+        # check_frequency runs once per distinct (term, frequency) pair
+        pairs = list(zip(terms.tolist(), columns[field]))
+        valid = {pair: check_frequency(*pair) for pair in set(pairs)}
+        check_rows("loans", ids, np.array([valid[pair] for pair in pairs], dtype=bool),
+                   f"{field.replace('_', ' ')} and loan term does not match")
+    periods = np.where(types == "effective", "annually", periods)
+    issues = parse_dates("loans", ids, columns["issue_date"])
+    for loan in zip(ids.tolist(), faces.tolist(), loan_banks, issues, terms.tolist(), columns["payment_frequency"],
+                    rates.tolist(), types.tolist(), periods.tolist(), columns["interest_payment_frequency"]):
+        loan = Loan.trusted(*loan)
+        add_obj(loans, loans_by_id, loan)
+        link_obj(loans_by_bank, loan.bank.id, loan)
+    if not with_amortizations:
+        return
+
+    # amortizations, checked against the loan they belong to (its face value is the balance at loading time)
+    columns = storage.columns("amortizations", AMORTIZATION_FIELDS)
+    ids = np.array(columns["id"], dtype=np.int64)
+    loan_ids = np.array(columns["loan_id"], dtype=np.int64)
+    values = np.array(columns["value"], dtype=float)
+    amort_dates = parse_dates("amortizations", ids, columns["amort_date"])
+    ordinals = np.array([amort_date.toordinal() for amort_date in amort_dates], dtype=np.int64)
+    check_rows("amortizations", ids, first_occurrences(ids), "duplicated id")
+    all_loan_ids = np.array([loan.id for loan in loans], dtype=np.int64)
+    check_rows("amortizations", ids, np.isin(loan_ids, all_loan_ids), "no loan with this id in database")
+    order = np.argsort(all_loan_ids)
+    positions = order[np.searchsorted(all_loan_ids, loan_ids, sorter=order)]
+    loan_faces = np.array([loan.face_value for loan in loans], dtype=float)[positions]
+    loan_issues = np.array([loan.issue_date.toordinal() for loan in loans], dtype=np.int64)[positions]
+    # one maturity per distinct (issue date, term) instead of one per loan (each one also goes into the
+    # maturity_date cache)
+    maturities = {terms: maturity_date(*terms).toordinal() for terms in {(loan.issue_date, loan.loan_term)
+                                                                          for loan in loans}}
+    loan_maturities = np.array([maturities[loan.issue_date, loan.loan_term] for loan in loans],
+                               dtype=np.int64)[positions]
+    check_rows("amortizations", ids, values >= 0, "amortization value must be a positive number")
+    check_rows("amortizations", ids, values <= loan_faces, "amortization value can not be greater than loan balance")
+    check_rows("amortizations", ids, ordinals <= date.today().toordinal(),
+               "amortization date can not be greater than today")
+    check_rows("amortizations", ids, (loan_issues < ordinals) & (ordinals <= loan_maturities),
+               "amortization date must be after the loan issue date and not after the loan maturity date")
+    for id, loan_id, value, amort_date, position in zip(ids.tolist(), loan_ids.tolist(), values.tolist(), amort_dates,
+                                                        positions.tolist()):
+        amortization = Amortization.trusted(id, loan_id, value, amort_date)
+        add_obj(amortizations, amortizations_by_id, amortization)
+        loans[position].add_amortization(amortization)
+
+
+def first_occurrences(values):
+    """
+    Input: values, a sequence of values
+    Returns a boolean array with True where a value appears for the first time
+    """
+    values = np.asarray(values)
+    first = np.zeros(len(values), dtype=bool)
+    first[np.unique(values, return_index=True)[1]] = True
+    return first
+
+
+def check_rows(table, ids, valid, message):
+    """
+    Input: table, the table name
+    Input: ids, an array with the id of each row
+    Input: valid, a boolean array with True for the rows passing one integrity check
+    Input: message, the reason a row fails the check
+    Raises ValueError naming the first row that fails the check
+    """
+    if not valid.all():
+        raise ValueError(f"Invalid {table} row (id {ids[np.flatnonzero(~valid)[0]]}): {message}")
+
+
+# dates as this program writes them: parsed with date.fromisoformat, which gives the same date as the setters' format
+ISO_DATE = re.compile("[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+
+def parse_dates(table, ids, values):
+    """
+    Input: table, the table name
+    Input: ids, an array with the id of each row
+    Input: values, the strings of one date column
+    Returns the values as dates, parsed with the format of the setters (YYYY-MM-DD). Raises ValueError naming the
+    first row whose date is not in that format
+    """
+    dates = []
+    for id, value in zip(ids.tolist(), values):
+        value = str(value)
+        try:
+            if ISO_DATE.fullmatch(value):
+                dates.append(date.fromisoformat(value))
+            else:
+                # other spellings the setters accept (i.e. without leading zeros)
+                dates.append(datetime.strptime(value, '%Y-%m-%d').date())
+        except ValueError:
+            raise ValueError(f"Invalid {table} row (id {id}): invalid date format, should be YYYY-MM-DD")
+    return dates
+
+
+def snapshot_key():
+    """
+    Returns the key a snapshot is valid for: the engine flags the cash flows were computed with and the
+    size, modification time and hash of every csv file
+    """
+    return VECTORIZED, CENTS, tuple(file_signature(cwd / path) for path, fields in TABLES.values())
+
+
+def load_snapshot():
+    """
+    Restores banks, loans and amortizations, with the cash flows already computed, from the snapshot if it was taken
+    from the current csv files (csv storage and no journal to replay). Returns True if the snapshot was restored
+    """
+    global snapshot_date
+    if not SNAPSHOT or STORAGE != "csv" or (STREAM and not STREAM_OBJECTS) or (cwd / journal_path).exists() or \
+            (cwd / compacting_path).exists():
+        return False
+    try:
+        with open(cwd / snapshot_path, "rb") as file:
+            snapshot = pickle.load(file)
+    except (OSError, EOFError, AttributeError, pickle.UnpicklingError):
+        # missing, partly written or taken by a version of the program with other classes
+        return False
+    if snapshot["key"] != snapshot_key():
+        return False
+    for bank in snapshot["banks"]:
+        add_obj(banks, banks_by_id, bank)
+        banks_by_name[bank.bank] = bank
+    for loan in snapshot["loans"]:
+        add_obj(loans, loans_by_id, loan)
+        link_obj(loans_by_bank, loan.bank.id, loan)
+    for amortization in snapshot["amortizations"]:
+        add_obj(amortizations, amortizations_by_id, amortization)
+    # the actual cash flows depend on today's date
+    if snapshot["date"] != date.today():
+        for loan in loans:
+            loan.update_act()
+    snapshot_date = snapshot["date"]
+    return True
+
+
+def save_snapshot():
+    """
+    Saves banks, loans and amortizations, with the cash flows computed so far, as the snapshot of the current
+    csv files, unless the session was restored from a snapshot of the same date and saved no changes. Written to a
+    temporary file that replaces the snapshot once complete
+    """
+    if not SNAPSHOT or STORAGE != "csv" or summarized or not fully_loaded:
+        return
+    # the snapshot on disk is still the one of the csv files: neither hashing them nor pickling again is needed
+    if snapshot_date == date.today() and saved_entries == 0:
+        return
+    snapshot = {
+        "key": snapshot_key(),
+        "date": date.today(),
+        "banks": banks,
+        "loans": loans,
+        "amortizations": amortizations,
+    }
+    temp = f"{cwd / snapshot_path}.tmp"
+    with open(temp, "wb") as file:
+        pickle.dump(snapshot, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, cwd / snapshot_path)
+
+
+def columns_key():
+    """
+    Returns the key the column files are valid for: the engine flags the cash flows were computed with and the size
+    and modification time of every csv file (not their hash, so that checking it doesn't read the files)
+    """
+    return [VECTORIZED, CENTS, [[os.stat(cwd / path).st_size, os.stat(cwd / path).st_mtime_ns]
+                                for path, fields in TABLES.values()]]
+
+
+def open_columns():
+    """
+    Returns the ColumnStore of the column files if they were written from the current csv files (csv storage and
+    no journal to replay), otherwise None
+    """
+    if not COLUMNAR or STORAGE != "csv" or (cwd / journal_path).exists() or (cwd / compacting_path).exists():
+        return None
+    try:
+        store = ColumnStore(cwd / columns_path)
+    except (OSError, ValueError):
+        return None
+    if store.meta["key"] != columns_key():
+        return None
+    return store
+
+
+def save_columns():
+    """
+    Writes the amortizations and the cash flows computed so far (loans whose cash flows were not read are left for
+    load_loan to compute) as the column files of the current csv files, unless the column files are up to date.
+    Needs every row in memory: a session that only looked loans up leaves the column files as they are
+    """
+    if not COLUMNAR or STORAGE != "csv" or summarized or not fully_loaded:
+        return
+    # a stale date only marks the actual cash flows dirty when they are read (see load_loan)
+    if open_columns() is not None:
+        return
+    write_columns(cwd / columns_path, {"key": columns_key(), "date": str(date.today())},
+                  [(a.id, a.loan_id, a.value, a.amort_date.toordinal()) for a in amortizations],
+                  [(loan.id, schedule.values) for loan in loans if (schedule := loan.computed_schedule()) is not None],
+                  len(LoanSchedule.COLUMNS))
+
+
+def load_loan(loan_id):
+    """
+    Input: loan_id, the id of a loan
+    Returns the loan (None if there is no such loan). While not fully loaded, a loan that is not in memory is read
+    with its amortizations from the storage backend: only that loan's rows are read, so a report on one loan runs
+    without loading the whole history. With column files (see COLUMNAR) the amortizations and cash flows of the
+    loan are read from them instead
+    """
+    if (loan := get_by_id(loans_by_id, loan_id)) is not None or fully_loaded:
+        return loan
+    if not (rows := storage.find("loans", "id", loan_id)):
+        return None
+    # banks are always in memory: the loan finds its bank by normalized name
+    loan = Loan(**rows[0])
+    add_obj(loans, loans_by_id, loan)
+    link_obj(loans_by_bank, loan.bank.id, loan)
+    if column_store is not None:
+        group = Amortization.load_group(loan, column_store.amortizations(loan.id))
+    else:
+        group = Amortization.load_group(loan, storage.find("amortizations", "loan_id", loan.id))
+    loan.add_amortizations(group)
+    for amortization in group:
+        add_obj(amortizations, amortizations_by_id, amortization)
+    loan.update_sch()
+    loan.update_act()
+    if column_store is not None and (values := column_store.schedule(loan.id)) is not None:
+        loan.set_schedule(LoanSchedule(loan.issue_date, loan.loan_term, values))
+        # the actual cash flows depend on today's date
+        if column_store.meta["date"] != str(date.today()):
+            loan.update_act()
+    return loan
+
+
+def load_amortization(amort_id):
+    """
+    Input: amort_id, the id of an amortization
+    Returns the amortization (None if there is no such amortization), reading its loan with load_loan if it is not
+    in memory
+    """
+    if (amortization := get_by_id(amortizations_by_id, amort_id)) is not None or fully_loaded:
+        return amortization
+    if not (rows := storage.find("amortizations", "id", amort_id)):
+        return None
+    load_loan(rows[0]["loan_id"])
+    return get_by_id(amortizations_by_id, amort_id)
+
+
+def save_entry(table, entries, entry, op):
+    """
+    Input: table, the name of the table entry belongs to (banks, loans or amortizations)
+    Input: entries, the list of objects of the table
+    Input: entry, the object created, edited or deleted
+    Input: op, "add" for a created entry, "put" for an edited one, "del" for a deleted one
+    Saves one change: appends it to the journal (csv storage with JOURNAL True) or hands it to the storage backend
+    """
+    global journal_records, saved_entries
+    saved_entries += 1
+    if STORAGE == "csv" and JOURNAL:
+        append_journal(cwd / journal_path, table, "del" if op == "del" else "put", entry)
+        journal_records += 1
+        if JOURNAL_LIMIT and journal_records >= JOURNAL_LIMIT:
+            compact_journal(background=True)
+    else:
+        storage.save(table, op, entry, entries)
+    if op == "add":
+        print("Data saved")
+
+
+def replay_journal(path):
+    """
+    Input: path, a journal file
+    Applies the journal records, oldest first, to the banks, loans and amortizations loaded from the csv files.
+    Edited entries are validated like new ones and updated in place, so lists keep their order
+    """
+    global journal_records
+    replay = {
+        "banks": replay_bank,
+        "loans": replay_loan,
+        "amortizations": replay_amortization,
+    }
+    for table, op, values in read_journal(path):
+        fields = TABLES[table][1]
+        replay_record = replay[table]
+        # a record cut short (i.e. the program stopped while writing it) is skipped
+        if len(values) == len(fields):
+            replay_record(op, dict(zip(fields, values)))
+            journal_records += 1
+
+
+def replay_bank(op, row):
+    """
+    Input: op, "put" or "del"
+    Input: row, a dict with the csv fields of one bank
+    Creates, renames or deletes the bank
+    """
+    bank = get_by_id(banks_by_id, row["id"])
+    if op == "del":
+        if bank is not None:
+            remove_obj(banks, banks_by_id, bank)
+            del banks_by_name[bank.bank]
+    elif bank is None:
+        bank = Bank(**row)
+        add_obj(banks, banks_by_id, bank)
+        banks_by_name[bank.bank] = bank
+    elif bank.bank != bank_key(row["bank"]):
+        del banks_by_name[bank.bank]
+        bank.bank = row["bank"]
+        banks_by_name[bank.bank] = bank
+
+
+def replay_loan(op, row):
+    """
+    Input: op, "put" or "del"
+    Input: row, a dict with the csv fields of one loan
+    Creates, edits or deletes the loan
+    """
+    loan = get_by_id(loans_by_id, row["id"])
+    if op == "del":
+        if loan is not None:
+            remove_obj(loans, loans_by_id, loan)
+            unlink_obj(loans_by_bank, loan.bank.id, loan)
+    elif loan is None:
+        loan = Loan(**row)
+        add_obj(loans, loans_by_id, loan)
+        link_obj(loans_by_bank, loan.bank.id, loan)
+    else:
+        # fields are copied from a validated loan: setting them one by one could fail on cross-field checks
+        edited = Loan(**row)
+        unlink_obj(loans_by_bank, loan.bank.id, loan)
+        for field in LOAN_FIELDS[1:]:
+            setattr(loan, "_" + field, getattr(edited, field))
+        loan.principal_balance = loan.face_value
+        link_obj(loans_by_bank, loan.bank.id, loan)
+
+
+def replay_amortization(op, row):
+    """
+    Input: op, "put" or "del"
+    Input: row, a dict with the csv fields of one amortization
+    Creates, edits or deletes the amortization
+    """
+    amortization = get_by_id(amortizations_by_id, row["id"])
+    if op == "del":
+        if amortization is not None:
+            get_by_id(loans_by_id, amortization.loan_id).actual_amortizations.remove(amortization)
+            remove_obj(amortizations, amortizations_by_id, amortization)
+    elif amortization is None:
+        amortization = Amortization(**row)
+        add_obj(amortizations, amortizations_by_id, amortization)
+        get_by_id(loans_by_id, amortization.loan_id).add_amortization(amortization)
+    else:
+        edited = Amortization(**row)
+        amortization._value = edited.value
+        amortization._amort_date = edited.amort_date
+
+
+def compact_journal(background=False):
+    """
+    Input: background, True to write the csv files in a separate thread
+    Writes banks, loans and amortizations back into the csv files and deletes the journal. The journal is moved
+    aside first, so changes saved while a background compaction runs go to a new journal
+    """
+    global journal_records, compaction
+    # a read only session keeps no amortization objects to write back
+    if summarized:
+        return
+    if compaction is not None:
+        compaction.join()
+        compaction = None
+    journal = cwd / journal_path
+    if not journal.exists():
+        return
+    compacting = journal.replace(cwd / compacting_path)
+    # rows are taken now: the thread must not read the lists while the menu changes them
+    tables = [(cwd / TABLES[table][0], TABLES[table][1], [entry.row() for entry in entries]) for table, entries in
+              (("banks", banks), ("loans", loans), ("amortizations", amortizations))]
+    journal_records = 0
+    if background:
+        compaction = Thread(target=write_tables, args=(tables, compacting))
+        compaction.start()
+    else:
+        write_tables(tables, compacting)
+
+
+def write_tables(tables, journal):
+    """
+    Input: tables, a list of (path, fields, rows) tuples, rows being the row tuples of the entries
+    Input: journal, the journal file already contained in tables
+    Rewrites every csv file in tables and deletes journal
+    """
+    for path, fields, rows in tables:
+        write_csv_file(path, fields, rows)
+    journal.unlink()
+
+
+def update_loans(l):
+    """
+    Input: l, a list of loans
+    Computes the scheduled and actual cash flows of every loan in l. Loans sharing term and frequencies are stacked
+    into arrays (one row per loan) and each group is computed in one pass, instead of calling
+    update_sch and update_act loan by loan. With WORKERS > 1 chunks of loans are computed in parallel processes.
+    With CACHE, loans whose cash flows are in the schedule cache are read from it and only the others are computed
+    """
+    cache = open_cache()
+    computed = []
+    rows = []
+    keys = []
+    for loan in l:
+        loan.update_balance()
+        if cache is not None:
+            scheduled, actual = loan.cache_keys()
+            if (values := cache.get(scheduled)) is not None and (actual_values := cache.get(actual)) is not None:
+                loan.set_schedule(LoanSchedule(loan.issue_date, loan.loan_term, np.concatenate([values, actual_values])))
+                continue
+            keys.append((scheduled, actual))
+        computed.append(loan)
+        rows.append(loan.terms())
+    if WORKERS > 1 and len(rows) > CHUNK_SIZE:
+        schedules = parallel_schedules(rows, WORKERS, CHUNK_SIZE, CENTS)
+    else:
+        schedules = batch_schedules(rows, CENTS)
+    for loan, schedule in zip(computed, schedules):
+        loan.set_schedule(schedule)
+    if cache is not None:
+        for (scheduled, actual), schedule in zip(keys, schedules):
+            cache.put(scheduled, schedule.scheduled)
+            cache.put(actual, schedule.actual)
+
+
 def menu(op):
     """
     Input: op, an option string that indicates which menu to display
@@ -1119,6 +2072,13 @@ def menu(op):
                 "Choose an option: (m)anage, (r)eports, (q)uit: ").lower()
             match option:
                 case "m":
+                    # nothing can be changed when amortizations were loaded as period totals
+                    if summarized:
+                        print("Management is not available: amortizations were loaded as period totals (read only session)")
+                        continue
+                    # csv changes are written from the lists (journal compaction, table rewrites): they need every row
+                    if STORAGE == "csv":
+                        load_all()
                     menu("manage")
                 case "r":
                     menu("reports")
@@ -1156,32 +2116,33 @@ def menu(op):
             match option:
                 case "c":
                     try:
-                        # get data from user and create a new loan object
+                        # get data from user and create a new loan object (ids follow the last loan of all of them)
+                        load_all()
                         if loan := Loan.get():
                             # add loan to loan list
-                            loans.append(loan)
+                            add_obj(loans, loans_by_id, loan)
+                            link_obj(loans_by_bank, loan.bank.id, loan)
                             loan.update_sch()
                             loan.update_act()
-                            append_csv_file(cwd / loans_path,
-                                            LOAN_FIELDS, loan)
+                            save_entry("loans", loans, loan, "add")
                     except EOFError:
                         print()
                         print("Data not saved")
                 case "e":
                     while True:
-                        if len(loans) != 0:
+                        if has_rows("loans", loans):
                             try:
                                 if loan_id := input("Please input the loan id you would like to edit (At any moment press CTRL + D to go back to the previous menu): "):
                                     # if loan_id not in loans
-                                    if not any(str(obj.id) == str(loan_id) for obj in loans):
+                                    if load_loan(loan_id) is None:
                                         print(
                                             f"Invalid input: No loan with id: {loan_id} in database. Please enter one of the following loan ids:")
+                                        load_all()
                                         loans_report(loans)
                                         continue
                                     else:
                                         # get loan based on loan_id
-                                        loan = get_obj(
-                                            loans, int(loan_id), "id")
+                                        loan = get_by_id(loans_by_id, loan_id)
                                         loans_report({loan})
                                         loan.edit()
                                         break
@@ -1194,21 +2155,21 @@ def menu(op):
                             break
                 case "d":
                     while True:
-                        if len(loans) != 0:
+                        if has_rows("loans", loans):
                             try:
                                 if loan_id := input("Please input the loan id you would like to delete (At any moment press CTRL + D to go back to the previous menu): "):
                                     # if loan_id not in loans
-                                    if not any(str(obj.id) == str(loan_id) for obj in loans):
+                                    if load_loan(loan_id) is None:
                                         print(
                                             f"Invalid input: No loan with id: {loan_id} in database. Please enter one of the following loan ids:")
+                                        load_all()
                                         loans_report(loans)
                                         continue
                                     else:
                                         # get loan based on loan_id
                                         loans_report(
-                                            {get_obj(loans, int(loan_id), "id")})
-                                        get_obj(loans, int(loan_id),
-                                                "id").delete()
+                                            {get_by_id(loans_by_id, loan_id)})
+                                        get_by_id(loans_by_id, loan_id).delete()
                                         break
                             except EOFError:
                                 print()
@@ -1233,34 +2194,34 @@ def menu(op):
                 case "c":
                     try:
                         # get data from user and create a new amortization object
+                        load_all()
                         if amortization := Amortization.get():
                             # add amortization to amortizations list
-                            amortizations.append(amortization)
+                            add_obj(amortizations, amortizations_by_id, amortization)
                             # get loan based on amortization.loan_id and add amortization
-                            loan = get_obj(loans, int(
-                                amortization.loan_id), "id")
+                            loan = get_by_id(loans_by_id, amortization.loan_id)
                             loan.add_amortization(amortization)
-                            loan.update_act()
-                            append_csv_file(cwd / amort_path,
-                                            AMORTIZATION_FIELDS, amortization)
+                            loan.update_act(amortization.amort_date)
+                            save_entry("amortizations",
+                                       amortizations, amortization, "add")
                     except EOFError:
                         print()
                         print("Data not saved")
                 case "e":
                     while True:
-                        if len(amortizations) != 0:
+                        if has_rows("amortizations", amortizations):
                             try:
                                 if amort_id := input("Please input the amortization id you would like to edit (At any moment press CTRL + D to go back to the previous menu): "):
                                     # if amortization_id not in amortizations
-                                    if not any(str(obj.id) == str(amort_id) for obj in amortizations):
+                                    if load_amortization(amort_id) is None:
                                         print(
                                             f"Invalid input: No amortization with id: {amort_id} in database. Please enter one of the following amortization ids:")
+                                        load_all()
                                         amort_report(amortizations)
                                         continue
                                     else:
                                         # get amort based on amortization_id
-                                        amortization = get_obj(
-                                            amortizations, int(amort_id), "id")
+                                        amortization = get_by_id(amortizations_by_id, amort_id)
                                         amort_report({amortization})
                                         amortization.edit()
                                         break
@@ -1273,21 +2234,21 @@ def menu(op):
                             break
                 case "d":
                     while True:
-                        if len(amortizations) != 0:
+                        if has_rows("amortizations", amortizations):
                             try:
                                 if amort_id := input("Please input the amortization id you would like to delete (At any moment press CTRL + D to go back to the previous menu): "):
                                     # if amortization_id not in amortizations
-                                    if not any(str(obj.id) == str(amort_id) for obj in amortizations):
+                                    if load_amortization(amort_id) is None:
                                         print(
                                             f"Invalid input: No amortization with id: {amort_id} in database. Please enter one of the following amortization ids:")
+                                        load_all()
                                         amort_report(amortizations)
                                         continue
                                     else:
                                         # get amort based on amortization_id
                                         amort_report(
-                                            {get_obj(amortizations, int(amort_id), "id")})
-                                        get_obj(amortizations, int(
-                                            amort_id), "id").delete()
+                                            {get_by_id(amortizations_by_id, amort_id)})
+                                        get_by_id(amortizations_by_id, amort_id).delete()
                                         break
                             except EOFError:
                                 print()
@@ -1314,8 +2275,9 @@ def menu(op):
                         # get data from user and create a new bank object
                         if bank := Bank.get():
                             # add bank to banks list
-                            banks.append(bank)
-                            append_csv_file(cwd / bank_path, BANK_FIELDS, bank)
+                            add_obj(banks, banks_by_id, bank)
+                            banks_by_name[bank.bank] = bank
+                            save_entry("banks", banks, bank, "add")
                     except EOFError:
                         print()
                         print("Data not saved")
@@ -1325,15 +2287,14 @@ def menu(op):
                             try:
                                 if bank_id := input("Please input the bank id you would like to edit (At any moment press CTRL + D to go back to the previous menu): "):
                                     # if bank_id not in banks
-                                    if not any(str(obj.id) == str(bank_id) for obj in banks):
+                                    if get_by_id(banks_by_id, bank_id) is None:
                                         print(
                                             f"Invalid input: No bank with id: {bank_id} in database. Please enter one of the following bank ids:")
                                         banks_report(banks)
                                         continue
                                     else:
                                         # get bank based on bank_id
-                                        bank = get_obj(
-                                            banks, int(bank_id), "id")
+                                        bank = get_by_id(banks_by_id, bank_id)
                                         banks_report({bank})
                                         bank.edit()
                                         break
@@ -1349,17 +2310,17 @@ def menu(op):
                             try:
                                 if bank_id := input("Please input the bank id you would like to delete (At any moment press CTRL + D to go back to the previous menu): "):
                                     # if bank_id not in banks
-                                    if not any(str(obj.id) == str(bank_id) for obj in banks):
+                                    if get_by_id(banks_by_id, bank_id) is None:
                                         print(
                                             f"Invalid input: No bank with id: {bank_id} in database. Please enter one of the following bank ids:")
                                         banks_report(banks)
                                         continue
                                     else:
-                                        # get bank based on bank_id and delete it
+                                        # get bank based on bank_id and delete it (checking every loan for the bank)
+                                        load_all()
                                         banks_report(
-                                            {get_obj(banks, int(bank_id), "id")})
-                                        get_obj(banks, int(bank_id),
-                                                "id").delete()
+                                            {get_by_id(banks_by_id, bank_id)})
+                                        get_by_id(banks_by_id, bank_id).delete()
                                         break
                             except EOFError:
                                 print()
@@ -1382,27 +2343,33 @@ def menu(op):
                 "Choose an option: (l)oans, (a)mortizations, (b)anks, (c)ash flow, (g)o back, (q)uit: ").lower()
             match option:
                 case "l":
+                    load_all()
                     loans_report(loans)
                 case "a":
+                    # the amortizations were folded into period totals: there are no rows to list
+                    if summarized:
+                        print("Amortizations report is not available: amortizations were loaded as period totals (read only session)")
+                        continue
+                    load_all()
                     amort_report(amortizations)
                 case "b":
                     banks_report(banks)
                 case "c":
                     while True:
-                        if len(loans) != 0:
+                        if has_rows("loans", loans):
                             try:
                                 if loan_id := input("Please input a loan id for which you would like its cash flow (At any moment press CTRL + D to go back to the previous menu): "):
                                     # if loan_id not in loans
-                                    if not any(str(obj.id) == str(loan_id) for obj in loans):
+                                    if load_loan(loan_id) is None:
                                         print(
                                             f"Invalid input: No loan with id: {loan_id} in database. Please enter one of the following loan ids:")
+                                        load_all()
                                         if check := loans_report(loans):
                                             break
                                         continue
                                     else:
                                         # get loan based on loan_id
-                                        loan = get_obj(
-                                            loans, int(loan_id), "id")
+                                        loan = get_by_id(loans_by_id, loan_id)
                                         loans_report({loan})
                                         cash_flow_report(loan)
                                         break
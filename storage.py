@@ -0,0 +1,359 @@
+import csv
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+
+import numpy as np
+
+from helpers import bank_key, write_csv_file
+
+
+# sqlite column types by field name (fields not listed are stored as text)
+COLUMN_TYPES = {
+    "id": "INTEGER PRIMARY KEY",
+    "loan_id": "INTEGER NOT NULL",
+    "loan_term": "INTEGER",
+    "face_value": "REAL",
+    "interest_rate": "REAL",
+    "value": "REAL",
+}
+
+# sqlite indexes: amortizations are read loan by loan, loans are looked up by bank on renames
+INDEXES = {
+    "amortizations": "loan_id",
+    "loans": "bank",
+}
+
+# sqlite user_version of a database whose bank names are stored normalized (see SqliteStorage.normalize_banks)
+NORMALIZED_VERSION = 1
+
+
+# numeric fields parsed into numpy arrays by the parallel csv parser (other fields stay lists of strings).
+# loan_term is parsed as a float, like the loan_term setter does, so "12.0" is accepted and "12.5" rejected later
+NUMERIC_FIELDS = {
+    "id": np.int64,
+    "loan_id": np.int64,
+    "loan_term": float,
+    "face_value": float,
+    "interest_rate": float,
+    "value": float,
+}
+
+# csv files smaller than this are parsed in the calling process even with parse workers
+PARSE_MIN_SIZE = 1 << 20
+
+
+# flush policies: write every change right away, every flush_every changes, or only when the storage is closed
+FLUSH_POLICIES = ["immediate", "every", "exit"]
+
+
+class Storage:
+    """
+    Base of the storage backends: counts saved changes and flushes them following the flush policy
+    """
+
+    def __init__(self, flush="immediate", flush_every=1):
+        """
+        Input: flush, one of FLUSH_POLICIES
+        Input: flush_every, the number of changes written at once with the "every" policy
+        """
+        if flush not in FLUSH_POLICIES:
+            raise ValueError(f"Invalid flush policy: {flush}")
+        self.flush_policy = flush
+        self.flush_every = flush_every
+        self.pending = 0
+
+    def saved(self):
+        """
+        Counts one saved change and flushes the pending changes if the policy says so
+        """
+        self.pending += 1
+        if self.flush_policy == "immediate" or (self.flush_policy == "every" and self.pending >= self.flush_every):
+            self.flush()
+
+    def columns(self, table, fields):
+        """
+        Input: table, the table name
+        Input: fields, the fields of the table
+        Returns a dict mapping each field to the list of its values, in storage order
+        """
+        rows = list(self.rows(table))
+        return {field: [row[field] for row in rows] for field in fields}
+
+    def has_rows(self, table):
+        """
+        Input: table, the table name
+        Returns True if the table has at least one row
+        """
+        return next(iter(self.rows(table)), None) is not None
+
+    def flush(self):
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+
+
+class CsvStorage(Storage):
+    """
+    Storage backend over the data/*.csv files: one csv file per table. Changed tables are kept in a dirty set and
+    rewritten (atomically, see write_csv_file) when flushed
+    """
+
+    def __init__(self, cwd, tables, flush="immediate", flush_every=1, workers=0):
+        """
+        Input: cwd, the directory the csv paths are relative to
+        Input: tables, a dict mapping table names to (csv path, fields) tuples
+        Input: flush, flush_every, the flush policy (see Storage)
+        Input: workers, the processes columns parses big files with (0 or 1: parse in this process)
+        """
+        super().__init__(flush, flush_every)
+        self.cwd = cwd
+        self.tables = tables
+        self.workers = workers
+        # table name -> list of objects to write on the next flush
+        self.dirty = {}
+
+    def rows(self, table):
+        """
+        Input: table, the table name
+        Returns an iterator over the rows of the table as dicts of strings, in file order
+        """
+        path, fields = self.tables[table]
+        with open(self.cwd / path) as file:
+            yield from csv.DictReader(file)
+
+    def find(self, table, column, value):
+        """
+        Input: table, the table name
+        Input: column, a field of the table
+        Input: value, the value looked up
+        Returns a list with the rows of the table whose column equals value as dicts, in file order
+        """
+        return [row for row in self.rows(table) if row[column] == str(value)]
+
+    def columns(self, table, fields):
+        """
+        Input: table, the table name
+        Input: fields, the fields of the table
+        Returns a dict mapping each field to its values, in file order: NUMERIC_FIELDS as numpy arrays, other fields
+        as lists of strings. With workers, a big file is split into newline aligned byte ranges parsed in parallel
+        """
+        path = self.cwd / self.tables[table][0]
+        if self.workers <= 1 or os.path.getsize(path) < PARSE_MIN_SIZE:
+            header, ranges = csv_ranges(path, 1)
+            return parse_csv_range(path, *ranges[0], header, fields)
+        header, ranges = csv_ranges(path, self.workers)
+        with ProcessPoolExecutor(self.workers) as executor:
+            parts = list(executor.map(parse_csv_range, repeat(path), *zip(*ranges), repeat(header), repeat(fields)))
+        return {field: np.concatenate([part[field] for part in parts]) if field in NUMERIC_FIELDS
+                else list(chain.from_iterable(part[field] for part in parts)) for field in fields}
+
+    def save(self, table, op, entry, entries):
+        """
+        Input: table, the table name
+        Input: op, "add" for a created entry, "put" for an edited one, "del" for a deleted one
+        Input: entry, the object created, edited or deleted
+        Input: entries, the list of objects of the table
+        Marks the table dirty. Created entries too: appending to the csv file in place could leave a torn last row
+        """
+        self.mark_dirty(table, entries)
+        self.saved()
+
+    def mark_dirty(self, table, entries):
+        """
+        Input: table, the table name
+        Input: entries, the list of objects of the table
+        Adds the table to the dirty set: it is rewritten from entries on the next flush
+        """
+        self.dirty[table] = entries
+
+    def flush(self):
+        """
+        Rewrites every dirty table and empties the dirty set
+        """
+        for table, entries in self.dirty.items():
+            path, fields = self.tables[table]
+            write_csv_file(self.cwd / path, fields, (entry.row() for entry in entries))
+        self.dirty = {}
+        super().flush()
+
+
+def csv_ranges(path, parts):
+    """
+    Input: path, a csv file with a header line
+    Input: parts, the number of ranges wanted
+    Returns the header fields and a list of (start, end) byte ranges covering the rows of the file, each starting at
+    the beginning of a line. Fields must not contain line breaks (true of every file written by this program)
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        header = next(csv.reader([file.readline().decode()]))
+        bounds = [file.tell()]
+        for part in range(1, parts):
+            file.seek(bounds[0] + (size - bounds[0]) * part // parts)
+            # move to the beginning of the next line
+            file.readline()
+            if bounds[-1] < file.tell() < size:
+                bounds.append(file.tell())
+    bounds.append(size)
+    return header, list(zip(bounds, bounds[1:]))
+
+
+def parse_csv_range(path, start, end, header, fields):
+    """
+    Input: path, a csv file
+    Input: start, end, a byte range of whole lines of the file
+    Input: header, the fields of the file, in column order
+    Input: fields, the fields to return
+    Returns a dict mapping each field to its values in the range: NUMERIC_FIELDS as numpy arrays (raising ValueError
+    for values that are not numbers), other fields as lists of strings
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        lines = file.read(end - start).decode().splitlines()
+    rows = [row for row in csv.reader(lines) if row]
+    for row in rows:
+        if len(row) != len(header):
+            raise ValueError(f"Invalid row in {path}: {','.join(row)}")
+    columns = {}
+    for field in fields:
+        i = header.index(field)
+        values = [row[i] for row in rows]
+        columns[field] = np.array(values, dtype=NUMERIC_FIELDS[field]) if field in NUMERIC_FIELDS else values
+    return columns
+
+
+class SqliteStorage(Storage):
+    """
+    Storage backend over one sqlite database: one indexed table per csv file. Changes are committed in one
+    transaction when flushed
+    """
+
+    def __init__(self, path, tables, flush="immediate", flush_every=1, source=None):
+        """
+        Input: path, the database file
+        Input: tables, a dict mapping table names to (csv path, fields) tuples
+        Input: flush, flush_every, the flush policy (see Storage)
+        Input: source, another storage backend (i.e. CsvStorage) a new database is filled from. Only used when the
+        database file does not exist: the database is then built in a temporary file, moved in place once filled
+        """
+        super().__init__(flush, flush_every)
+        self.fields = {table: fields for table, (csv_path, fields) in tables.items()}
+        if not os.path.exists(path):
+            temp = f"{path}.tmp"
+            # left over by an interrupted import
+            if os.path.exists(temp):
+                os.remove(temp)
+            self.connection = sqlite3.connect(temp)
+            self.create_tables()
+            if source is not None:
+                self.import_rows(source)
+            self.connection.close()
+            os.replace(temp, path)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.create_tables()
+        self.normalize_banks()
+
+    def create_tables(self):
+        """
+        Creates the tables and INDEXES that don't exist yet
+        """
+        with self.connection:
+            for table, fields in self.fields.items():
+                columns = ", ".join(f"{field} {COLUMN_TYPES.get(field, 'TEXT')}" for field in fields)
+                self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+            for table, column in INDEXES.items():
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+
+    def normalize_banks(self):
+        """
+        Normalizes the bank names of banks and loans with bank_key, once per database (databases filled before
+        import_rows normalized them), so that a bank rename finds its loans through the loans bank index
+        """
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] >= NORMALIZED_VERSION:
+            return
+        with self.connection:
+            for table in ("banks", "loans"):
+                for (name,) in self.connection.execute(f"SELECT DISTINCT bank FROM {table}").fetchall():
+                    if bank_key(name) != name:
+                        self.connection.execute(f"UPDATE {table} SET bank = ? WHERE bank = ?", (bank_key(name), name))
+            self.connection.execute(f"PRAGMA user_version = {NORMALIZED_VERSION}")
+
+    def import_rows(self, source):
+        """
+        Input: source, another storage backend (i.e. CsvStorage)
+        Copies every row of source into the database in one transaction. Bank names are normalized with bank_key,
+        so loans match their bank whatever the casing of the source
+        """
+        with self.connection:
+            for table, fields in self.fields.items():
+                self.connection.executemany(
+                    f"INSERT INTO {table} VALUES ({', '.join('?' * len(fields))})",
+                    ([bank_key(row[field]) if field == "bank" else row[field] for field in fields]
+                     for row in source.rows(table)))
+
+    def has_rows(self, table):
+        """
+        Input: table, the table name
+        Returns True if the table has at least one row
+        """
+        return self.connection.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None
+
+    def rows(self, table):
+        """
+        Input: table, the table name
+        Returns an iterator over the rows of the table as dicts, sorted by id
+        """
+        for row in self.connection.execute(f"SELECT * FROM {table} ORDER BY id"):
+            yield dict(row)
+
+    def find(self, table, column, value):
+        """
+        Input: table, the table name
+        Input: column, an indexed column (id, the bank name of banks or one of INDEXES)
+        Input: value, the value looked up
+        Returns a list with the rows of the table whose column equals value as dicts, sorted by id
+        """
+        return [dict(row) for row in
+                self.connection.execute(f"SELECT * FROM {table} WHERE {column} = ? ORDER BY id", (value,))]
+
+    def save(self, table, op, entry, entries=None):
+        """
+        Input: table, the table name
+        Input: op, "add" for a created entry, "put" for an edited one, "del" for a deleted one
+        Input: entry, the object created, edited or deleted
+        Input: entries, not used (only the row of entry is written)
+        Inserts, replaces or deletes the row of entry. A bank rename also renames the bank in its loans, in the same
+        transaction (names are stored normalized, see normalize_banks)
+        """
+        fields = self.fields[table]
+        row = entry.row()
+        try:
+            if op == "del":
+                self.connection.execute(f"DELETE FROM {table} WHERE id = ?", (entry.id,))
+            else:
+                if table == "banks":
+                    old = self.connection.execute("SELECT bank FROM banks WHERE id = ?", (entry.id,)).fetchone()
+                    if old is not None:
+                        self.connection.execute("UPDATE loans SET bank = ? WHERE bank = ?", (entry.bank, old["bank"]))
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})", row)
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        self.saved()
+
+    def flush(self):
+        """
+        Commits the pending changes
+        """
+        self.connection.commit()
+        super().flush()
+
+    def close(self):
+        super().close()
+        self.connection.close()
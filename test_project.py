@@ -0,0 +1,126 @@
+import random
+from datetime import date
+
+import numpy as np
+import pytest
+from dateutil.relativedelta import relativedelta
+
+import project
+from engine import LoanSchedule, actual_columns, round_array, scheduled_columns
+from helpers import MONTHS, PERIODS, convert_nominal_to_monthly_effective, generate_amortizations, \
+    generate_interests, generate_principals, period_calendar
+from project import Amortization, Bank, Loan
+
+
+FREQUENCIES = list(MONTHS) + ["at maturity"]
+
+
+def random_terms(rng):
+    # face value, issue date, term, payment frequency, rate, compounding period, interest payment frequency
+    term = rng.choice([6, 12, 24, 36, 60, 120, 360])
+    frequency = rng.choice([f for f in FREQUENCIES if f == "at maturity" or term % MONTHS[f] == 0])
+    interest_frequency = rng.choice([f for f in FREQUENCIES if f == "at maturity" or term % MONTHS[f] == 0])
+    # face values with cents and rates with two decimals, like the ones typed in the menus
+    face = rng.randrange(100, 50_000_000) / 100
+    issue = date(2015, 1, 1) + relativedelta(days=rng.randrange(4000))
+    return face, issue, term, frequency, rng.randrange(1, 2000) / 100, rng.choice(list(PERIODS)), interest_frequency
+
+
+def loop_scheduled(face, issue, term, frequency, rate, comp_period, interest_frequency):
+    # scheduled columns computed by the helpers.py loops
+    amortizations = generate_amortizations(face, term, issue, frequency)
+    principals_b, principals_a = generate_principals(face, term, amortizations, issue)
+    interests = generate_interests(principals_b, rate, comp_period, interest_frequency, issue)
+    return [list(column.values()) for column in (amortizations, principals_b, principals_a, interests)]
+
+
+def test_round_array():
+    # values whose scaled form np.round would see as exact halves (or not) while round() doesn't
+    values = [0.125, 0.135, 2.675, 1.005, 0.285, 1.015, 8.345, 50.025, 1234.565, -0.125, -2.675, 0.0, 1e-9]
+    rng = random.Random(1)
+    values += [rng.randrange(10 ** 8) / 1000 + 0.005 for i in range(2000)]
+    values += [rng.randrange(10 ** 8) / 1000 - 0.005 for i in range(2000)]
+    assert round_array(np.array(values), 2).tolist() == [round(value, 2) for value in values]
+
+
+@pytest.mark.parametrize("face", [100.05, 1000.05, 250.45, 10.01, 333.33, 1000000.03])
+def test_scheduled_columns_near_ties(face):
+    # face values whose payments fall on (binary approximations of) half cents
+    for term, frequency in [(2, "monthly"), (6, "bi-monthly"), (12, "quarterly"), (36, "semi-annually")]:
+        i_m = convert_nominal_to_monthly_effective(3.5, "monthly")
+        columns = scheduled_columns(face, term, frequency, i_m, frequency)
+        expected = loop_scheduled(face, date(2021, 1, 31), term, frequency, 3.5, "monthly", frequency)
+        assert [column.tolist() for column in columns] == expected
+
+
+def test_scheduled_columns():
+    rng = random.Random(2)
+    for i in range(300):
+        face, issue, term, frequency, rate, comp_period, interest_frequency = terms = random_terms(rng)
+        i_m = convert_nominal_to_monthly_effective(rate, comp_period)
+        columns = scheduled_columns(face, term, frequency, i_m, interest_frequency)
+        assert [column.tolist() for column in columns] == loop_scheduled(*terms)
+
+
+def test_scheduled_columns_batch():
+    # a group of loans sharing term and frequencies, one row per loan
+    rng = random.Random(3)
+    faces = [rng.randrange(100, 50_000_000) / 100 for i in range(50)]
+    rates = [rng.randrange(1, 2000) / 100 for i in range(50)]
+    rates_m = [convert_nominal_to_monthly_effective(rate, "quarterly") for rate in rates]
+    columns = scheduled_columns(np.array(faces), 60, "quarterly", np.array(rates_m), "semi-annually")
+    for k, (face, rate) in enumerate(zip(faces, rates)):
+        expected = loop_scheduled(face, date(2020, 2, 29), 60, "quarterly", rate, "quarterly", "semi-annually")
+        assert [column[k].tolist() for column in columns] == expected
+
+
+def test_actual_columns():
+    rng = random.Random(4)
+    for i in range(300):
+        face, issue, term, frequency, rate, comp_period, interest_frequency = random_terms(rng)
+        # actual amortization schedule: payments of any amount in any month, the rest at maturity
+        amounts = [rng.randrange(0, int(face * 100) // term) / 100 if rng.random() < 0.3 else 0 for k in range(term)]
+        amounts[-1] = round(face - sum(amounts[:-1]), 2)
+        schedule = dict(zip(period_calendar(issue, term)[1:], amounts))
+        principals_b, principals_a = generate_principals(face, term, schedule, issue)
+        interests = generate_interests(principals_b, rate, comp_period, interest_frequency, issue)
+        i_m = convert_nominal_to_monthly_effective(rate, comp_period)
+        columns = actual_columns(face, np.array(amounts), i_m, interest_frequency)
+        assert [column.tolist() for column in columns] == \
+            [list(column.values()) for column in (principals_b, principals_a, interests)]
+
+
+def new_loan(terms):
+    face, issue, term, frequency, rate, comp_period, interest_frequency = terms
+    return Loan.trusted(1, face, Bank.trusted(1, "Chase"), issue, term, frequency, rate, "nominal", comp_period,
+                        interest_frequency)
+
+
+def cash_flows(loan):
+    return [list(getattr(loan, column).values()) for column in LoanSchedule.COLUMNS]
+
+
+@pytest.mark.parametrize("vectorized, cents", [(True, False), (False, False), (True, True)])
+def test_update_act_since(monkeypatch, vectorized, cents):
+    # the actual cash flows recomputed from the period of a new amortization are the ones of a full computation
+    monkeypatch.setattr(project, "VECTORIZED", vectorized)
+    monkeypatch.setattr(project, "CENTS", cents)
+    rng = random.Random(5)
+    today = date.today()
+    for i in range(20):
+        term = rng.choice([24, 36, 60, 120])
+        issue = today - relativedelta(months=rng.randrange(1, term))
+        terms = (rng.randrange(100_000, 50_000_000) / 100, issue, term, "monthly", rng.randrange(1, 2000) / 100,
+                 "monthly", rng.choice(["monthly", "quarterly", "at maturity"]))
+        loan = new_loan(terms)
+        cash_flows(loan)
+        for id in range(1, 6):
+            amort_date = issue + relativedelta(days=rng.randrange(1, (today - issue).days))
+            value = rng.randrange(100, int(loan.principal_balance * 10)) / 100
+            amortization = Amortization.trusted(id, 1, value, amort_date)
+            loan.add_amortization(amortization)
+            loan.update_act(amort_date)
+            full = new_loan(terms)
+            full.add_amortizations(loan.actual_amortizations)
+            full.update_balance()
+            assert cash_flows(loan) == cash_flows(full)